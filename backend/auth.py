@@ -3,24 +3,43 @@ from fastapi.security import OAuth2AuthorizationCodeBearer, OAuth2PasswordBearer
 from google.oauth2 import id_token
 from google.auth.transport import requests
 import os
+import asyncio
+import hashlib
+import hmac
 from dotenv import load_dotenv
 import jwt
 from datetime import datetime, timedelta
 import logging
-import requests as http_requests
-from database import get_user_by_email, create_user, verify_password
-import traceback
+import httpx
+import bcrypt
+from database import get_user_by_email, create_user, set_user_google_id, verify_password, hash_password
 from pydantic import BaseModel
 from typing import Optional
-from jose import JWTError
+from cachetools import TTLCache
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO').upper())
 logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
 
+# JWT backend: JWT_BACKEND=rust swaps in the Rust-backed jwt_rs for token
+# encode/decode (an optional dependency, see requirements.txt); PyJWT otherwise
+jwt_backend = jwt
+# What decode raises for an invalid or expired token
+JWT_DECODE_ERRORS = (jwt.PyJWTError,)
+if os.getenv('JWT_BACKEND', 'pyjwt').lower() == 'rust':
+    try:
+        import jwt_rs
+        from jwt_rs import InvalidTokenError as RustInvalidTokenError
+    except ImportError:
+        logger.warning("JWT_BACKEND=rust but jwt_rs is not installed, falling back to PyJWT")
+    else:
+        jwt_backend = jwt_rs
+        # jwt_rs raises its own exception classes, not PyJWT's
+        JWT_DECODE_ERRORS = (jwt.PyJWTError, RustInvalidTokenError)
+
 # OAuth2 settings
 GOOGLE_CLIENT_ID = os.getenv('GOOGLE_CLIENT_ID')
 GOOGLE_CLIENT_SECRET = os.getenv('GOOGLE_CLIENT_SECRET')
@@ -29,11 +48,42 @@ JWT_ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 REDIRECT_URI = "http://localhost:3000/auth/callback"
 
+# Hash verified against when the user doesn't exist, so a missing account
+# costs the same bcrypt round as a wrong password
+_DUMMY_HASH = hash_password("x" * 16)
+
+# Building _DUMMY_HASH already loaded bcrypt and ran hashpw; run one cheap
+# checkpw as well so the first login after a deploy isn't the cold one.
+# Real hashes keep BCRYPT_ROUNDS.
+verify_password("warm", bcrypt.hashpw(b"warm", bcrypt.gensalt(rounds=4)))
+
+# Logins that passed bcrypt within the last 30 seconds, so a page reload or
+# client retry doesn't pay for another verify. Entries are keyed by a hash of
+# the email, password and stored hash under a key derived from JWT_SECRET;
+# failures are never cached.
+_recent_logins = TTLCache(maxsize=10_000, ttl=30)
+_RECENT_LOGIN_KEY = hashlib.blake2b((JWT_SECRET or "").encode(), digest_size=32).digest()
+
+def _recent_login_key(email: str, password: str, password_hash: str) -> bytes:
+    material = "\0".join((email, password, password_hash)).encode()
+    return hashlib.blake2b(material, key=_RECENT_LOGIN_KEY, digest_size=16).digest()
+
 # OAuth2 scheme
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
 router = APIRouter()
 
+# Shared async HTTP client so Google token exchanges reuse pooled connections
+# and don't block the event loop
+http_client = httpx.AsyncClient(
+    timeout=10.0,
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=50)
+)
+
+@router.on_event("shutdown")
+async def close_http_client():
+    await http_client.aclose()
+
 class AuthCallbackRequest(BaseModel):
     code: str
 
@@ -63,7 +113,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, JWT_SECRET, algorithm=JWT_ALGORITHM)
+    encoded_jwt = jwt_backend.encode(to_encode, JWT_SECRET, algorithm=JWT_ALGORITHM)
     return encoded_jwt
 
 async def get_current_user(token: str = Depends(oauth2_scheme)):
@@ -73,14 +123,14 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        payload = jwt_backend.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
         email: str = payload.get("sub")
         if email is None:
             raise credentials_exception
         token_data = TokenData(email=email)
-    except JWTError:
+    except JWT_DECODE_ERRORS:
         raise credentials_exception
-    user = get_user_by_email(email=token_data.email)
+    user = await asyncio.to_thread(get_user_by_email, token_data.email)
     if user is None:
         raise credentials_exception
     return user
@@ -108,13 +158,13 @@ async def handle_google_callback(request: AuthCallbackRequest):
         
         logger.info("Exchanging code for tokens...")
         
-        response = http_requests.post(
+        response = await http_client.post(
             token_url,
             data=data,
             headers=headers
         )
         
-        if not response.ok:
+        if not response.is_success:
             error_detail = response.json().get('error_description', 'Unknown error')
             logger.error(f"Token exchange failed: {error_detail}")
             logger.error(f"Response status: {response.status_code}")
@@ -128,7 +178,8 @@ async def handle_google_callback(request: AuthCallbackRequest):
         logger.info("Successfully exchanged code for tokens")
         
         # Get user info from Google
-        idinfo = id_token.verify_oauth2_token(
+        idinfo = await asyncio.to_thread(
+            id_token.verify_oauth2_token,
             tokens["id_token"], 
             requests.Request(), 
             GOOGLE_CLIENT_ID
@@ -136,17 +187,32 @@ async def handle_google_callback(request: AuthCallbackRequest):
         logger.info(f"Successfully verified ID token for user: {idinfo['email']}")
         
         # Check if user exists
-        user = get_user_by_email(idinfo["email"])
+        user = await asyncio.to_thread(get_user_by_email, idinfo["email"])
         if not user:
             logger.info(f"Creating new user: {idinfo['email']}")
             # Create new user
-            user = create_user(
+            user = await asyncio.to_thread(
+                create_user,
                 email=idinfo["email"],
                 name=idinfo.get("name", ""),
                 google_id=idinfo["sub"]
             )
         else:
             logger.info(f"User already exists: {idinfo['email']}")
+            stored_google_id = user.get("google_id")
+            if not stored_google_id:
+                # First Google sign-in for this account; link it so later
+                # sign-ins have to come from the same Google account
+                await asyncio.to_thread(set_user_google_id, user["email"], idinfo["sub"])
+            # Constant-time compare so the stored Google ID can't be probed byte by byte
+            elif not hmac.compare_digest(
+                stored_google_id.encode(), idinfo["sub"].encode()
+            ):
+                logger.warning(f"Google account mismatch for user: {idinfo['email']}")
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Google account does not match this user"
+                )
         
         # Create JWT token
         access_token = create_access_token({"sub": user["email"]})
@@ -161,9 +227,10 @@ async def handle_google_callback(request: AuthCallbackRequest):
                 "name": user["name"]
             }
         }
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error in Google callback: {str(e)}")
-        logger.error(traceback.format_exc())
+        logger.exception("Error in Google callback: %s", e)
         raise HTTPException(
             status_code=400, 
             detail=f"Authentication failed: {str(e)}"
@@ -172,7 +239,7 @@ async def handle_google_callback(request: AuthCallbackRequest):
 async def get_user_profile(email: str):
     """Get user profile by email."""
     try:
-        user = get_user_by_email(email)
+        user = await asyncio.to_thread(get_user_by_email, email)
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         
@@ -188,7 +255,8 @@ async def get_user_profile(email: str):
 @router.post("/signup", response_model=User)
 async def signup(user_data: UserCreate):
     try:
-        user = create_user(
+        user = await asyncio.to_thread(
+            create_user,
             email=user_data.email,
             password=user_data.password,
             first_name=user_data.first_name,
@@ -210,18 +278,21 @@ async def signup(user_data: UserCreate):
 @router.post("/login", response_model=Token)
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     try:
-        logger.info(f"Login attempt for user: {form_data.username}")
-        user = get_user_by_email(form_data.username)
-        if not user:
-            logger.warning(f"Login failed: User not found - {form_data.username}")
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Incorrect email or password",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-            
-        if not verify_password(form_data.password, user["password_hash"]):
-            logger.warning(f"Login failed: Invalid password for user - {form_data.username}")
+        logger.info("Login attempt for user: %s", form_data.username)
+        user = await asyncio.to_thread(get_user_by_email, form_data.username)
+        hashed = user["password_hash"] if user else _DUMMY_HASH
+        login_key = _recent_login_key(form_data.username, form_data.password, hashed)
+        if user and login_key in _recent_logins:
+            password_ok = True
+        else:
+            password_ok = await asyncio.to_thread(verify_password, form_data.password, hashed)
+            if user and password_ok:
+                _recent_logins[login_key] = True
+        if not user or not password_ok:
+            if not user:
+                logger.warning(f"Login failed: User not found - {form_data.username}")
+            else:
+                logger.warning(f"Login failed: Invalid password for user - {form_data.username}")
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Incorrect email or password",
@@ -232,13 +303,12 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
         access_token = create_access_token(
             data={"sub": user["email"]}, expires_delta=access_token_expires
         )
-        logger.info(f"Login successful for user: {form_data.username}")
+        logger.info("Login successful for user: %s", form_data.username)
         return {"access_token": access_token, "token_type": "bearer"}
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Login error: {str(e)}")
-        logger.error(traceback.format_exc())
+        logger.exception("Login error: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="An error occurred during login"
@@ -1,105 +1,118 @@
 import sqlite3
 import os
+import queue
+import threading
+from contextlib import contextmanager
 from typing import Optional
 from log import logger
 from datetime import datetime
 import logging
 from typing import List, Dict, Any
-from passlib.context import CryptContext
+import bcrypt
+from cachetools import TTLCache
 
 DATABASE_PATH = "tax_manager.db"
+GST_DATABASE_PATH = "gst-helper.db"
 
-# Initialize password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Connections kept open per pooled database
+POOL_SIZE = 8
+
+# Prepared statements each long-lived connection keeps, keyed by SQL text.
+# Above sqlite3's default of 128, so the app's queries, including each
+# variant get_invoices builds, stay prepared instead of being evicted.
+STATEMENT_CACHE_SIZE = 256
+
+# One long-lived connection per thread, opened lazily by get_db()
+_pool = threading.local()
+
+# Cache-aside store for user rows; get_current_user looks a user up on every
+# authenticated request. Entries are dropped by invalidate_cached_user().
+_user_cache = TTLCache(maxsize=10_000, ttl=60)
+_user_cache_lock = threading.Lock()
+
+# bcrypt cost factor for new password hashes
+BCRYPT_ROUNDS = 12
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO').upper())
 logger = logging.getLogger(__name__)
 
+# Columns added since the original schema, as (column, type and default) per table
+MIGRATION_COLUMNS = {
+    'users': [
+        ('name', 'TEXT'),
+        ('google_id', 'TEXT'),
+    ],
+    'invoices': [
+        ('supplier', 'TEXT'),
+        ('total_amount', 'REAL'),
+        ('gst_amount', 'REAL'),
+        ('net_amount', 'REAL'),
+        ('invoice_date', 'TEXT'),
+        ('invoice_number', 'TEXT'),
+        ('category', "TEXT DEFAULT 'Other'"),
+        ('gst_eligible', 'BOOLEAN DEFAULT TRUE'),
+        ('file_path', 'TEXT'),
+        ('is_system_date', 'BOOLEAN DEFAULT FALSE'),
+        ('invoice_type', "TEXT DEFAULT 'expense'"),
+        ('status', "TEXT DEFAULT 'pending'"),
+    ],
+    'tax_calculations': [
+        ('income', 'REAL'),
+        ('expenses', 'REAL'),
+        ('gst_collected', 'REAL'),
+        ('gst_paid', 'REAL'),
+        ('net_gst', 'REAL'),
+        ('taxable_income', 'REAL'),
+        ('tax_payable', 'REAL'),
+        ('user_id', 'INTEGER'),
+    ],
+}
+
 def migrate_db():
     """Migrate the database to the latest schema."""
+    conn = None
     try:
         conn = sqlite3.connect(DATABASE_PATH)
-        c = conn.cursor()
         
         # First, ensure all tables exist
         init_db()
         
-        # Now perform migrations
-        
-        # Check if users table needs migration
-        c.execute("PRAGMA table_info(users)")
-        columns = [col[1] for col in c.fetchall()]
-        
-        # Add name column if it doesn't exist
-        if 'name' not in columns:
-            c.execute('ALTER TABLE users ADD COLUMN name TEXT')
-            logger.info("Added name column to users table")
-        
-        # Check if invoices table needs migration
-        c.execute("PRAGMA table_info(invoices)")
-        columns = [col[1] for col in c.fetchall()]
-        
-        # Add missing columns to invoices table
-        if 'supplier' not in columns:
-            c.execute('ALTER TABLE invoices ADD COLUMN supplier TEXT')
-        if 'total_amount' not in columns:
-            c.execute('ALTER TABLE invoices ADD COLUMN total_amount REAL')
-        if 'gst_amount' not in columns:
-            c.execute('ALTER TABLE invoices ADD COLUMN gst_amount REAL')
-        if 'net_amount' not in columns:
-            c.execute('ALTER TABLE invoices ADD COLUMN net_amount REAL')
-        if 'invoice_date' not in columns:
-            c.execute('ALTER TABLE invoices ADD COLUMN invoice_date TEXT')
-        if 'invoice_number' not in columns:
-            c.execute('ALTER TABLE invoices ADD COLUMN invoice_number TEXT')
-        if 'category' not in columns:
-            c.execute('ALTER TABLE invoices ADD COLUMN category TEXT DEFAULT "Other"')
-        if 'gst_eligible' not in columns:
-            c.execute('ALTER TABLE invoices ADD COLUMN gst_eligible BOOLEAN DEFAULT TRUE')
-        if 'file_path' not in columns:
-            c.execute('ALTER TABLE invoices ADD COLUMN file_path TEXT')
-        if 'is_system_date' not in columns:
-            c.execute('ALTER TABLE invoices ADD COLUMN is_system_date BOOLEAN DEFAULT FALSE')
-        if 'invoice_type' not in columns:
-            c.execute('ALTER TABLE invoices ADD COLUMN invoice_type TEXT DEFAULT "expense"')
-        if 'status' not in columns:
-            c.execute('ALTER TABLE invoices ADD COLUMN status TEXT DEFAULT "pending"')
-        
-        logger.info("Updated invoices table schema")
+        conn.execute('PRAGMA journal_mode=WAL')
         
-        # Check if tax_calculations table needs migration
-        c.execute("PRAGMA table_info(tax_calculations)")
-        columns = [col[1] for col in c.fetchall()]
+        # Apply every missing column in one write transaction
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for table, wanted in MIGRATION_COLUMNS.items():
+                columns = {col[1] for col in conn.execute(f'PRAGMA table_info({table})').fetchall()}
+                for column, definition in wanted:
+                    if column not in columns:
+                        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+                        logger.info(f"Added {column} column to {table} table")
+            
+            # Index the per-user lookups once user_id is guaranteed to exist; the
+            # tax_calculations one also covers the ORDER BY in get_user_tax_calculations
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_taxcalc_user_created
+                ON tax_calculations(user_id, created_at DESC)
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_invoices_user ON invoices(user_id)')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
         
-        # Add missing columns to tax_calculations table
-        if 'income' not in columns:
-            c.execute('ALTER TABLE tax_calculations ADD COLUMN income REAL')
-        if 'expenses' not in columns:
-            c.execute('ALTER TABLE tax_calculations ADD COLUMN expenses REAL')
-        if 'gst_collected' not in columns:
-            c.execute('ALTER TABLE tax_calculations ADD COLUMN gst_collected REAL')
-        if 'gst_paid' not in columns:
-            c.execute('ALTER TABLE tax_calculations ADD COLUMN gst_paid REAL')
-        if 'net_gst' not in columns:
-            c.execute('ALTER TABLE tax_calculations ADD COLUMN net_gst REAL')
-        if 'taxable_income' not in columns:
-            c.execute('ALTER TABLE tax_calculations ADD COLUMN taxable_income REAL')
-        if 'tax_payable' not in columns:
-            c.execute('ALTER TABLE tax_calculations ADD COLUMN tax_payable REAL')
-        if 'user_id' not in columns:
-            c.execute('ALTER TABLE tax_calculations ADD COLUMN user_id INTEGER')
-        
-        conn.commit()
         logger.info("Database migration completed successfully")
     except Exception as e:
-        logger.error(f"Error migrating database: {str(e)}")
+        logger.exception("Error migrating database: %s", e)
         raise
     finally:
-        conn.close()
+        if conn:
+            conn.close()
 
 def init_db():
     """Initialize the database with required tables."""
+    conn = None
     try:
         conn = sqlite3.connect(DATABASE_PATH)
         cursor = conn.cursor()
@@ -160,23 +173,219 @@ def init_db():
         conn.commit()
         logger.info("Database initialized successfully")
     except Exception as e:
-        logger.error(f"Error initializing database: {str(e)}")
+        logger.exception("Error initializing database: %s", e)
         raise
     finally:
-        conn.close()
+        if conn:
+            conn.close()
+
+def init_gst_db():
+    """Create the gst-helper.db tables and indexes main.py relies on."""
+    conn = None
+    try:
+        conn = sqlite3.connect(GST_DATABASE_PATH)
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS invoices (
+                id TEXT PRIMARY KEY,
+                supplier TEXT,
+                total_amount REAL,
+                gst_amount REAL,
+                net_amount REAL,
+                invoice_date TEXT,
+                invoice_number TEXT,
+                category TEXT,
+                gst_eligible INTEGER,
+                file_path TEXT,
+                created_at TEXT,
+                updated_at TEXT,
+                is_system_date INTEGER DEFAULT 0,
+                invoice_type TEXT DEFAULT 'expense',
+                status TEXT DEFAULT 'pending'
+            )
+        ''')
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS expenses (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                date TEXT,
+                amount REAL,
+                gst_amount REAL,
+                description TEXT,
+                category TEXT,
+                is_gst_eligible INTEGER,
+                created_at TEXT
+            )
+        ''')
+
+        # Expenses used to be dated DD/MM/YYYY, which doesn't sort or range
+        # compare as text; rewrite any left over as YYYY-MM-DD
+        cursor.execute('''
+            UPDATE expenses
+            SET date = substr(date, 7, 4) || '-' || substr(date, 4, 2) || '-' || substr(date, 1, 2)
+            WHERE date GLOB '[0-9][0-9]/[0-9][0-9]/[0-9][0-9][0-9][0-9]'
+        ''')
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS tax_calculations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                annual_income REAL NOT NULL,
+                deductions TEXT NOT NULL,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        # Background invoice jobs (POST /process-invoice?background=true)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS invoice_jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                status_code INTEGER,
+                result TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        # Covers the GST-collected sum, which can then be read from the index alone
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_invoices_gst ON invoices(gst_eligible, gst_amount)')
+        # Same for GST paid on expenses
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_expenses_gst ON expenses(is_gst_eligible, gst_amount)')
+        # Duplicate checks match on date and amount; also serves date lookups
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_invoices_date ON invoices(invoice_date, total_amount)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_invoices_status ON invoices(status)')
+        # Lets /cleanup-duplicates group invoices straight off the index
+        # instead of sorting the table into a temporary b-tree
+        cursor.execute(
+            'CREATE INDEX IF NOT EXISTS idx_invoices_dup_group '
+            'ON invoices(supplier, total_amount, invoice_date, category, id)'
+        )
+        # Covers the expenses summary's date-range query so it's answered from
+        # the index alone. Being date-led it also serves any other date filter
+        # and ORDER BY date DESC, so it supersedes the old date-only index
+        cursor.execute('DROP INDEX IF EXISTS idx_expenses_date')
+        cursor.execute(
+            'CREATE INDEX IF NOT EXISTS idx_expenses_summary '
+            'ON expenses(date, category, amount, gst_amount, is_gst_eligible, description)'
+        )
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_taxcalc_created ON tax_calculations(created_at)')
+
+        conn.commit()
+        # Gathers planner statistics only for tables that need them, so
+        # it stays cheap on every startup, unlike a full ANALYZE
+        cursor.execute('PRAGMA optimize')
+        logger.info("GST database initialized successfully")
+    except Exception as e:
+        logger.exception("Error initializing GST database: %s", e)
+        raise
+    finally:
+        if conn:
+            conn.close()
+
+def configure_connection(conn: sqlite3.Connection, cache_size_kib: int) -> None:
+    """Apply the pragmas every long-lived connection runs with."""
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute(f"PRAGMA cache_size=-{cache_size_kib}")
+    # Read pages straight from the mapped file instead of copying them in
+    conn.execute("PRAGMA mmap_size=268435456")
+
+class SQLitePool:
+    """Fixed-size pool of SQLite connections shared across threads."""
+
+    def __init__(self, path: str, size: int = POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = queue.Queue(maxsize=size)
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE)
+        configure_connection(conn, cache_size_kib=64000)
+        return conn
+
+    def open(self) -> None:
+        """Open any connections the pool doesn't have yet."""
+        with self._lock:
+            while self._opened < self.size:
+                self._idle.put(self._connect())
+                self._opened += 1
+
+    def close(self) -> None:
+        """Close the pooled connections (call once requests have finished)."""
+        with self._lock:
+            while True:
+                try:
+                    self._idle.get_nowait().close()
+                except queue.Empty:
+                    break
+                self._opened -= 1
+
+    def stats(self) -> Dict[str, int]:
+        """Pool size and how many connections are open, idle and checked out."""
+        opened = self._opened
+        idle = self._idle.qsize()
+        return {"size": self.size, "open": opened, "idle": idle, "in_use": opened - idle}
+
+    @contextmanager
+    def connection(self):
+        """Check a connection out of the pool, opening one if the pool isn't full yet."""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                if self._opened < self.size:
+                    conn = self._connect()
+                    self._opened += 1
+            if conn is None:
+                conn = self._idle.get()
+        try:
+            yield conn
+        finally:
+            # Never hand the next caller a half-finished transaction
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+# Pool for the invoice/expense database used by main.py
+gst_pool = SQLitePool(GST_DATABASE_PATH)
+
+def get_conn():
+    """Borrow a pooled gst-helper.db connection: `with get_conn() as conn:`."""
+    return gst_pool.connection()
 
 def get_db():
-    """Get a database connection."""
+    """Get this thread's database connection, opening it on first use."""
+    conn = getattr(_pool, "conn", None)
+    if conn is not None:
+        return conn
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
+        conn = sqlite3.connect(DATABASE_PATH, check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE)
         conn.row_factory = sqlite3.Row
+        configure_connection(conn, cache_size_kib=20000)
+        _pool.conn = conn
         return conn
     except Exception as e:
         logger.error(f"Error connecting to database: {str(e)}")
         raise
 
+def invalidate_cached_user(email: str) -> None:
+    """Drop a user from the lookup cache after their row changes."""
+    with _user_cache_lock:
+        _user_cache.pop(email, None)
+
 def get_user_by_email(email: str) -> Optional[Dict[str, Any]]:
     """Get a user by email."""
+    with _user_cache_lock:
+        cached = _user_cache.get(email)
+    if cached is not None:
+        return dict(cached)
+
     try:
         conn = get_db()
         cursor = conn.cursor()
@@ -185,13 +394,14 @@ def get_user_by_email(email: str) -> Optional[Dict[str, Any]]:
         user = cursor.fetchone()
         
         if user:
+            user = dict(user)
+            with _user_cache_lock:
+                _user_cache[email] = user
             return dict(user)
         return None
     except Exception as e:
         logger.error(f"Error getting user: {str(e)}")
         raise
-    finally:
-        conn.close()
 
 def create_user(email: str, password: str, first_name: str = None, last_name: str = None) -> Dict[str, Any]:
     """Create a new user."""
@@ -200,19 +410,19 @@ def create_user(email: str, password: str, first_name: str = None, last_name: st
         cursor = conn.cursor()
         
         # Hash the password
-        password_hash = pwd_context.hash(password)
+        password_hash = hash_password(password)
         
         # Combine first_name and last_name into name if they exist
         name = None
         if first_name or last_name:
             name = f"{first_name or ''} {last_name or ''}".strip()
         
-        cursor.execute('''
-            INSERT INTO users (email, password_hash, first_name, last_name, name)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (email, password_hash, first_name, last_name, name))
-        
-        conn.commit()
+        with conn:
+            cursor.execute('''
+                INSERT INTO users (email, password_hash, first_name, last_name, name)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (email, password_hash, first_name, last_name, name))
+        invalidate_cached_user(email)
         
         # Get the created user
         cursor.execute('SELECT * FROM users WHERE id = ?', (cursor.lastrowid,))
@@ -227,12 +437,30 @@ def create_user(email: str, password: str, first_name: str = None, last_name: st
     except Exception as e:
         logger.error(f"Error creating user: {str(e)}")
         raise
-    finally:
-        conn.close()
+
+def set_user_google_id(email: str, google_id: str) -> None:
+    """Link a Google account to a user that isn't linked to one yet."""
+    try:
+        conn = get_db()
+        with conn:
+            conn.execute(
+                "UPDATE users SET google_id = ? WHERE email = ? AND (google_id IS NULL OR google_id = '')",
+                (google_id, email)
+            )
+        invalidate_cached_user(email)
+    except Exception as e:
+        logger.error(f"Error linking Google account: {str(e)}")
+        raise
+
+def hash_password(password: str) -> str:
+    """Hash a password with bcrypt."""
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode()
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash."""
-    return pwd_context.verify(plain_password, hashed_password)
+    if isinstance(hashed_password, str):
+        hashed_password = hashed_password.encode()
+    return bcrypt.checkpw(plain_password.encode(), hashed_password)
 
 def get_user_tax_calculations(email: str) -> list:
     """Get all tax calculations for a user by email."""
@@ -243,32 +471,20 @@ def get_user_tax_calculations(email: str) -> list:
     cursor.execute('SELECT id FROM users WHERE email = ?', (email,))
     user = cursor.fetchone()
     if not user:
-        conn.close()
         return []
     
     user_id = user[0]
     
-    # Then get the calculations
-    cursor.execute('SELECT * FROM tax_calculations WHERE user_id = ? ORDER BY created_at DESC', (user_id,))
-    calculations = cursor.fetchall()
-    conn.close()
+    # Then get the calculations, by column name rather than position
+    cursor.execute('''
+        SELECT id, user_id, income, expenses, gst_collected, gst_paid, net_gst,
+               taxable_income, tax_payable, created_at
+        FROM tax_calculations
+        WHERE user_id = ?
+        ORDER BY created_at DESC
+    ''', (user_id,))
     
-    return [{
-        'id': calc[0],
-        'user_id': calc[1],
-        'name': calc[2],
-        'annual_income': calc[3],
-        'deductions': calc[4],
-        'income': calc[5],
-        'expenses': calc[6],
-        'gst_collected': calc[7],
-        'gst_paid': calc[8],
-        'net_gst': calc[9],
-        'taxable_income': calc[10],
-        'tax_payable': calc[11],
-        'created_at': calc[12],
-        'updated_at': calc[13]
-    } for calc in calculations]
+    return [dict(calc) for calc in cursor.fetchall()]
 
 def save_tax_calculation(
     email: str,
@@ -291,25 +507,23 @@ def save_tax_calculation(
     cursor.execute('SELECT id FROM users WHERE email = ?', (email,))
     user = cursor.fetchone()
     if not user:
-        conn.close()
         raise ValueError("User not found")
     
     user_id = user[0]
     
     # Save the calculation
-    cursor.execute('''
-        INSERT INTO tax_calculations 
-        (user_id, name, annual_income, deductions, income, expenses, gst_collected, 
-         gst_paid, net_gst, taxable_income, tax_payable)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (
-        user_id, name, annual_income, deductions, income, expenses, 
-        gst_collected, gst_paid, net_gst, taxable_income, tax_payable
-    ))
+    with conn:
+        cursor.execute('''
+            INSERT INTO tax_calculations 
+            (user_id, name, annual_income, deductions, income, expenses, gst_collected, 
+             gst_paid, net_gst, taxable_income, tax_payable)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            user_id, name, annual_income, deductions, income, expenses, 
+            gst_collected, gst_paid, net_gst, taxable_income, tax_payable
+        ))
     
     calculation_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
     
     return {
         'id': calculation_id,
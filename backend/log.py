@@ -1,14 +1,26 @@
+import atexit
 import logging
+import os
+import queue
 import sys
+from logging.handlers import QueueHandler, QueueListener
 
-# Configure logging
+# Stdout and the log file are written from a background thread, so request
+# threads only format a record and queue it instead of waiting on disk I/O
+log_queue = queue.SimpleQueue()
+log_listener = QueueListener(
+    log_queue,
+    logging.StreamHandler(sys.stdout),
+    logging.FileHandler('gst-helper.log')
+)
+log_listener.start()
+atexit.register(log_listener.stop)
+
+# Configure logging; LOG_LEVEL=DEBUG turns on the per-request debug output
 logging.basicConfig(
-    level=logging.INFO,
+    level=os.getenv('LOG_LEVEL', 'INFO').upper(),
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler('gst-helper.log')
-    ]
+    handlers=[QueueHandler(log_queue)]
 )
 
 # Create logger
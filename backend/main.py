@@ -1,22 +1,25 @@
 from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Depends, Request, Body
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from fastapi import Query
 import uvicorn
 from typing import Dict, Any, List, Optional
 import json
+import math
+import asyncio
+import functools
+import multiprocessing
+import orjson
 import logging
-import traceback
 import sys
 import os
 import pytesseract
-from PIL import Image, UnidentifiedImageError
-import io
+from PIL import Image, ImageOps, UnidentifiedImageError
 import pdf2image
 import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
-from pydantic import BaseModel, Field
-import sqlite3
+from pydantic import BaseModel, Field, validator
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
 from reportlab.lib import colors
@@ -27,22 +30,88 @@ from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, Tabl
 import uuid
 import re
 import shutil
+import threading
 from pathlib import Path
 from fastapi.security import OAuth2PasswordBearer
-from jose import JWTError, jwt
-from database import init_db, get_db, create_user, get_user_by_email, verify_password, migrate_db
+from database import init_db, init_gst_db, get_db, get_conn, gst_pool, create_user, get_user_by_email, verify_password, migrate_db
 from auth import router as auth_router
 from ssl_config import get_uvicorn_ssl_config
 
+# Prefer Google RE2 (linear-time automaton, no backtracking) for invoice
+# parsing when it's installed; the patterns below stick to syntax both
+# engines accept, with flags written inline since RE2 has no flag constants
+try:
+    import re2 as regex_engine
+except ImportError:
+    regex_engine = re
+
+# Render PDF pages in-process with PDFium when pypdfium2 is installed,
+# instead of running poppler's pdftoppm through pdf2image
+try:
+    import pypdfium2 as pdfium
+except ImportError:
+    pdfium = None
+
+# Hyperscan scans for every invoice field at once as a DFA, when installed
+try:
+    import hyperscan
+except ImportError:
+    hyperscan = None
+
+# Pages are OCRed in parallel across processes, so keep each tesseract to a
+# single OpenMP thread; its threading only adds contention on top of that.
+# Set before tesserocr loads libtesseract, and inherited by the OCR workers
+# and every tesseract subprocess.
+os.environ.setdefault('OMP_THREAD_LIMIT', '1')
+
+# Use libtesseract in-process through tesserocr when it's installed, so images
+# and PDF pages don't each pay for a tesseract fork and language model load
+try:
+    from tesserocr import PyTessBaseAPI, PSM, OEM
+except ImportError:
+    PyTessBaseAPI = None
+
+# Checked once rather than on every upload; the binary doesn't come or go
+# while the server is running. Looked up the way pytesseract runs it (on PATH
+# unless tesseract_cmd is set), so it isn't tied to /usr/bin.
+TESSERACT_OK = shutil.which(pytesseract.pytesseract.tesseract_cmd) is not None
+
 # Configure logging
 logging.basicConfig(
-    level=logging.INFO,
+    level=os.getenv('LOG_LEVEL', 'INFO').upper(),
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger('gst_helper')
 
-# Initialize FastAPI app
-app = FastAPI()
+# Initialize FastAPI app; orjson encodes responses much faster than stdlib json
+app = FastAPI(default_response_class=ORJSONResponse)
+
+# Largest invoice upload accepted, in bytes
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_MB', '25')) * 1024 * 1024
+
+class UploadSizeLimitMiddleware:
+    """Turn away invoice uploads whose Content-Length is over MAX_UPLOAD_BYTES
+    before the multipart body is read and spooled"""
+
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if (scope['type'] == 'http' and scope['method'] == 'POST'
+                and scope['path'].startswith('/process-invoice')):
+            content_length = dict(scope['headers']).get(b'content-length')
+            if content_length and content_length.isdigit() and int(content_length) > self.max_bytes:
+                response = ORJSONResponse(
+                    status_code=413,
+                    content={"detail": f"File too large. Maximum size is {self.max_bytes // (1024 * 1024)} MB"}
+                )
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+# Added before CORS so its responses still get the CORS headers
+app.add_middleware(UploadSizeLimitMiddleware, max_bytes=MAX_UPLOAD_BYTES)
 
 # Configure CORS
 app.add_middleware(
@@ -66,20 +135,121 @@ UPLOAD_DIR = os.getenv('UPLOAD_DIR', 'uploads')
 DB_DIR = os.getenv('DB_DIR', 'db')
 HOST = os.getenv('HOST', '0.0.0.0')
 PORT = int(os.getenv('PORT', '8000'))
+WORKERS = int(os.getenv('WORKERS', str(os.cpu_count() or 1)))
+
+# Known suppliers, most preferred first, with the (case-sensitive) keywords
+# that identify each one in the OCR text
+SUPPLIER_KEYWORDS = [
+    ("Apple Store", ("Apple Store",)),
+    ("Amart Furniture", ("AMART", "Amart")),
+    ("Bunnings", ("BUNNINGS", "Bunnings")),
+    ("Officeworks", ("OFFICEWORKS", "Officeworks")),
+]
+SUPPLIER_FIELDS = tuple(f'supplier_{i}' for i in range(len(SUPPLIER_KEYWORDS)))
+
+# Invoice parsing patterns, compiled once at import.
+# Every field is found in one finditer pass over INVOICE_FIELDS_PATTERN; the
+# named group that matched says which field it is. A labelled "Total"/"Order
+# Total" always wins, a bare amount at the end of a line is only the fallback.
+# Invoice and reference numbers are matched by keyword only, so their
+# (greedy) tokens can't swallow a date or total; the token is then read with
+# an anchored match at that position.
+INVOICE_FIELD_REGEXES = [
+    r'(?i:(?P<invoice_keyword>Invoice|Order|Sales Order))',
+    r'(?i:(?P<reference_keyword>Ref:))',
+    r'(?i:(?:Order Total|Total)\s*\$?\s*(?P<total>[\d,]+\.\d{2}))',
+    r'(?m:\$(?P<line_end_total>[\d,]+\.\d{2})\s*$)',
+    r'(?P<date_dmy_slash>\d{2}/\d{2}/\d{4})',
+    r'(?P<date_dmy_dash>\d{2}-\d{2}-\d{4})',
+    r'(?P<date_ymd>\d{4}-\d{2}-\d{2})',
+] + [
+    f'(?P<{field}>' + '|'.join(re.escape(keyword) for keyword in keywords) + ')'
+    for field, (_, keywords) in zip(SUPPLIER_FIELDS, SUPPLIER_KEYWORDS)
+]
+INVOICE_FIELDS_PATTERN = regex_engine.compile('|'.join(INVOICE_FIELD_REGEXES))
+
+# With hyperscan, INVOICE_FIELD_REGEXES are compiled into one database and
+# every hit is then read with that field's own pattern, anchored where it
+# starts. Scratch space can't be shared between concurrent scans, so each
+# thread gets its own.
+if hyperscan is not None:
+    INVOICE_FIELDS_DB = hyperscan.Database()
+    INVOICE_FIELDS_DB.compile(
+        expressions=[regex.encode() for regex in INVOICE_FIELD_REGEXES],
+        ids=list(range(len(INVOICE_FIELD_REGEXES))),
+        elements=len(INVOICE_FIELD_REGEXES),
+        flags=[hyperscan.HS_FLAG_SOM_LEFTMOST] * len(INVOICE_FIELD_REGEXES),
+    )
+    INVOICE_FIELD_MATCHERS = [regex_engine.compile(regex) for regex in INVOICE_FIELD_REGEXES]
+else:
+    INVOICE_FIELDS_DB = None
+hyperscan_scratch = threading.local()
+
+# Preferred in order: DD/MM/YYYY, DD-MM-YYYY, YYYY-MM-DD
+DATE_FIELDS = ('date_dmy_slash', 'date_dmy_dash', 'date_ymd')
+INVOICE_NUMBER_PATTERN = regex_engine.compile(r'(?i)(?:Invoice|Order|Sales Order)\s*#?\s*([A-Z0-9-]+)')
+REFERENCE_PATTERN = regex_engine.compile(r'(?i)Ref:\s*([A-Z0-9-]+)')
+
+# Worker processes for per-page OCR; tesseract is CPU-bound, so pages of a
+# multi-page PDF are recognised in parallel. Every uvicorn worker has its own
+# pool, so the cores are shared out between them. The worker count is read
+# from WEB_CONCURRENCY: uvicorn takes its --workers default from it, and
+# `python main.py` sets it to the number of workers it starts; a plain
+# `uvicorn main:app` is one worker. The pool is started on startup from a
+# forkserver, so workers don't inherit the server's threads (log listener,
+# database pool) mid-state.
+SERVER_WORKERS = max(1, int(os.getenv('WEB_CONCURRENCY', '1')))
+OCR_WORKERS = max(1, (os.cpu_count() or 1) // SERVER_WORKERS)
+OCR_POOL = None
+
+# Background invoice jobs (POST /process-invoice?background=true): at most one
+# running OCR job per pool worker. Job state lives in the invoice_jobs table
+# so any uvicorn worker can answer a poll; finished jobs are kept an hour.
+# The semaphore is created on startup so it binds to the server's event loop.
+ocr_job_slots = None
+running_invoice_jobs = set()
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize database on startup."""
+    global OCR_POOL, ocr_job_slots, TESSERACT_OK
+    # A fresh pool each startup, since shutdown stops the previous one
+    OCR_POOL = ProcessPoolExecutor(
+        max_workers=OCR_WORKERS,
+        mp_context=multiprocessing.get_context("forkserver")
+    )
+    ocr_job_slots = asyncio.Semaphore(OCR_WORKERS)
     try:
         from database import init_db, migrate_db
         init_db()
         migrate_db()
+        init_gst_db()
+        gst_pool.open()
         logger.info("Database initialized successfully")
     except Exception as e:
-        logger.error(f"Error initializing database: {str(e)}")
-        logger.error(traceback.format_exc())
+        logger.exception("Error initializing database: %s", e)
         raise
 
+    # Run tesseract once so its binary and libraries are already in the page
+    # cache for the first upload
+    if TESSERACT_OK:
+        try:
+            logger.info("Using tesseract %s", pytesseract.get_tesseract_version())
+        except Exception as e:
+            logger.error(f"Error running tesseract: {str(e)}")
+            TESSERACT_OK = False
+    if not TESSERACT_OK:
+        logger.error("Tesseract is not installed or not accessible; image OCR will fail")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the OCR worker processes and close pooled database connections."""
+    global OCR_POOL
+    if OCR_POOL is not None:
+        OCR_POOL.shutdown(wait=False, cancel_futures=True)
+        OCR_POOL = None
+    gst_pool.close()
+
 # Pydantic models
 class Invoice(BaseModel):
     id: str
@@ -93,11 +263,17 @@ class Invoice(BaseModel):
     gst_eligible: bool = True
     file_path: str = ""
     created_at: str = Field(default_factory=lambda: datetime.now().isoformat())
-    updated_at: str = Field(default_factory=lambda: datetime.now().isoformat())
+    updated_at: str = None
     is_system_date: bool = False
     invoice_type: str = "expense"
     status: str = "pending"
 
+    @validator('updated_at', pre=True, always=True)
+    def default_updated_at(cls, value, values):
+        # A new invoice is last updated when it's created; reuse that
+        # timestamp instead of reading the clock a second time
+        return value or values.get('created_at')
+
 class Expense(BaseModel):
     id: Optional[int] = None
     date: str
@@ -108,6 +284,17 @@ class Expense(BaseModel):
     is_gst_eligible: bool
     created_at: str = Field(default_factory=lambda: datetime.now().isoformat())
 
+    @validator('date', pre=True, always=True)
+    def iso_date(cls, value):
+        # Stored as YYYY-MM-DD so the summary's date range compares correctly
+        # as text; DD/MM/YYYY input is converted and a blank date means today
+        if not value:
+            return datetime.now().strftime('%Y-%m-%d')
+        try:
+            return datetime.strptime(value, '%d/%m/%Y').strftime('%Y-%m-%d')
+        except (TypeError, ValueError):
+            return value
+
 class ReportRequest(BaseModel):
     year: Optional[str] = None
     quarter: Optional[str] = None
@@ -121,136 +308,143 @@ class TaxCalculation(BaseModel):
     updated_at: Optional[str] = None
 
 # Database operations
+SUPPLIER_SUFFIX_PATTERN = re.compile(r'PTY\s+LTD|PTY|LTD')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+@functools.lru_cache(maxsize=4096)
 def normalize_supplier_name(supplier: str) -> str:
     """Normalize supplier name by removing extra whitespace and common variations"""
     if not supplier:
         return ""
-    # Remove extra whitespace and newlines
-    normalized = " ".join(supplier.split())
-    # Remove common variations
-    normalized = normalized.replace("PTY LTD", "").replace("PTY", "").replace("LTD", "")
-    normalized = normalized.replace("PTY.", "").replace("LTD.", "")
-    # Remove any remaining extra whitespace
-    return " ".join(normalized.split())
-
-def check_duplicate_invoice(invoice: Invoice, conn) -> bool:
-    c = conn.cursor()
-    # Normalize supplier name
-    normalized_supplier = normalize_supplier_name(invoice.supplier)
-    
-    # Check for existing invoice with same supplier, amount and date
-    # Only check essential fields and use normalized supplier name
-    c.execute('''
-        SELECT id FROM invoices 
-        WHERE LOWER(TRIM(supplier)) = LOWER(TRIM(?))
-        AND total_amount = ? 
-        AND invoice_date = ?
-    ''', (
-        normalized_supplier,
-        invoice.total_amount,
-        invoice.invoice_date
-    ))
-    return c.fetchone() is not None
+    # Drop PTY/LTD (and so "PTY LTD", "PTY." and "LTD."), then collapse whitespace
+    return WHITESPACE_PATTERN.sub(" ", SUPPLIER_SUFFIX_PATTERN.sub("", supplier)).strip()
+
+# Invoice columns in Invoice field order. Columns a valid Invoice can't hold
+# as NULL are filtered out in SQL, so rows can be built without validation.
+INVOICE_COLUMNS = (
+    'id, supplier, total_amount, gst_amount, net_amount, invoice_date, invoice_number, '
+    'category, gst_eligible, file_path, created_at, updated_at, is_system_date, invoice_type, status'
+)
+INVOICE_REQUIRED_COLUMNS = (
+    'id', 'supplier', 'total_amount', 'gst_amount', 'net_amount', 'invoice_date',
+    'invoice_number', 'category', 'file_path', 'created_at', 'updated_at'
+)
+
+INVOICE_FIELDS = tuple(column.strip() for column in INVOICE_COLUMNS.split(','))
+
+# Built once; sqlite3 keeps prepared statements per connection keyed by SQL
+# text, so pooled connections skip re-parsing it after the first save.
+# The insert only happens if no invoice with the same supplier, amount and
+# date exists yet (suppliers compared normalized and case-insensitively), so
+# the duplicate check and the write are one statement; a skipped duplicate
+# leaves rowcount at 0. There's no unique index behind it, as existing
+# databases may already hold duplicates until /cleanup-duplicates is run.
+SAVE_INVOICE_SQL = (
+    f"INSERT OR REPLACE INTO invoices ({INVOICE_COLUMNS}) "
+    f"SELECT {', '.join('?' * len(INVOICE_FIELDS))} "
+    "WHERE NOT EXISTS ("
+    "SELECT 1 FROM invoices WHERE LOWER(TRIM(supplier)) = LOWER(TRIM(?)) "
+    "AND total_amount = ? AND invoice_date = ?)"
+)
+
+def invoice_params(invoice: Invoice) -> tuple:
+    """SAVE_INVOICE_SQL parameters for an invoice"""
+    return tuple(getattr(invoice, field) for field in INVOICE_FIELDS) + (
+        normalize_supplier_name(invoice.supplier), invoice.total_amount, invoice.invoice_date
+    )
 
 def save_invoice(invoice: Invoice):
-    conn = None
     try:
-        conn = sqlite3.connect('gst-helper.db')
-        
-        # Check for duplicates before saving
-        if check_duplicate_invoice(invoice, conn):
-            logger.warning(f"Duplicate invoice detected for supplier {invoice.supplier} with amount {invoice.total_amount}")
-            return False
-            
-        c = conn.cursor()
-        c.execute('''
-            INSERT OR REPLACE INTO invoices 
-            (id, supplier, total_amount, gst_amount, net_amount, invoice_date, 
-             invoice_number, category, gst_eligible, file_path, created_at, updated_at, is_system_date, invoice_type, status)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            invoice.id,
-            invoice.supplier,
-            invoice.total_amount,
-            invoice.gst_amount,
-            invoice.net_amount,
-            invoice.invoice_date,
-            invoice.invoice_number,
-            invoice.category,
-            invoice.gst_eligible,
-            invoice.file_path,
-            invoice.created_at,
-            invoice.updated_at,
-            invoice.is_system_date,
-            invoice.invoice_type,
-            invoice.status
-        ))
-        
-        conn.commit()
-        return True
+        with get_conn() as conn:
+            # Skips the insert if it's a duplicate
+            if conn.execute(SAVE_INVOICE_SQL, invoice_params(invoice)).rowcount == 0:
+                logger.warning(f"Duplicate invoice detected for supplier {invoice.supplier} with amount {invoice.total_amount}")
+                return False
+            conn.commit()
+            return True
     except Exception as e:
-        logger.error(f"Error saving invoice: {str(e)}")
-        logger.error(traceback.format_exc())
+        logger.exception("Error saving invoice: %s", e)
         return False
-    finally:
-        if conn:
-            conn.close()
 
-def get_invoices() -> List[Invoice]:
+def save_invoices_bulk(invoices: List[Invoice]) -> int:
+    """Save many invoices in one transaction, skipping duplicates; returns how many were saved"""
+    try:
+        with get_conn() as conn:
+            # Each row's duplicate check also sees the rows inserted before it
+            saved = conn.executemany(SAVE_INVOICE_SQL, [invoice_params(invoice) for invoice in invoices]).rowcount
+            conn.commit()
+            if saved < len(invoices):
+                logger.warning(f"Skipped {len(invoices) - saved} duplicate invoices")
+            return saved
+    except Exception as e:
+        logger.exception("Error saving invoices: %s", e)
+        return 0
+
+def get_invoices(year: Optional[str] = None, quarter: Optional[int] = None) -> List[Invoice]:
+    """Fetch invoices, optionally only those dated in a year and/or quarter (1-4)"""
     try:
         logger.info("Fetching invoices from database")
-        conn = sqlite3.connect('gst-helper.db')
-        c = conn.cursor()
-        
-        c.execute('SELECT * FROM invoices')
-        rows = c.fetchall()
+        conditions = [f'{column} IS NOT NULL' for column in INVOICE_REQUIRED_COLUMNS]
+        params = []
+        if year:
+            # Dates starting with year: a range idx_invoices_date can search,
+            # up to the next string after that prefix
+            conditions.append('invoice_date >= ? AND invoice_date < ?')
+            params += [year, year[:-1] + chr(ord(year[-1]) + 1)]
+        if quarter:
+            quarter_start_month = (quarter - 1) * 3 + 1
+            conditions.append("CAST(substr(invoice_date, 6, 2) AS INTEGER) BETWEEN ? AND ?")
+            params += [quarter_start_month, quarter_start_month + 2]
         
         invoices = []
-        for row in rows:
-            try:
-                invoice = Invoice(
-                    id=str(row[0]),
-                    supplier=row[1],
-                    total_amount=float(row[2]),
-                    gst_amount=float(row[3]),
-                    net_amount=float(row[4]),
-                    invoice_date=row[5],
-                    invoice_number=row[6],
-                    category=row[7],
-                    gst_eligible=bool(row[8]),
-                    file_path=row[9],
-                    created_at=row[10],
-                    updated_at=row[11],
-                    is_system_date=bool(row[12]),
-                    invoice_type=row[13] or 'expense',  # Default to 'expense' if not specified
-                    status=row[14] or 'pending'  # Default to 'pending' if not specified
-                )
-                invoices.append(invoice)
-            except Exception as e:
-                logger.error(f"Error processing invoice row: {str(e)}")
-                logger.error(f"Row data: {row}")
-                continue
-        
-        logger.info(f"Successfully fetched {len(invoices)} invoices")
+        with get_conn() as conn:
+            # Keep the order invoices were added in, whichever index is used
+            c = conn.execute(
+                f'SELECT {INVOICE_COLUMNS} FROM invoices WHERE {" AND ".join(conditions)} ORDER BY rowid',
+                params
+            )
+            while True:
+                rows = c.fetchmany(1000)
+                if not rows:
+                    break
+                for row in rows:
+                    # id is TEXT and the amounts REAL, so sqlite3 already
+                    # returns str and float; only the 0/1 flags need converting
+                    invoices.append(Invoice.construct(
+                        id=row[0],
+                        supplier=row[1],
+                        total_amount=row[2],
+                        gst_amount=row[3],
+                        net_amount=row[4],
+                        invoice_date=row[5],
+                        invoice_number=row[6],
+                        category=row[7],
+                        gst_eligible=bool(row[8]),
+                        file_path=row[9],
+                        created_at=row[10],
+                        updated_at=row[11],
+                        is_system_date=bool(row[12]),
+                        invoice_type=row[13] or 'expense',  # Default to 'expense' if not specified
+                        status=row[14] or 'pending'  # Default to 'pending' if not specified
+                    ))
+        
+        logger.info("Successfully fetched %d invoices", len(invoices))
         return invoices
     except Exception as e:
-        logger.error(f"Error in get_invoices: {str(e)}")
-        logger.error(traceback.format_exc())
+        logger.exception("Error in get_invoices: %s", e)
         return []
-    finally:
-        conn.close()
 
 def get_total_expenses() -> Dict[str, float]:
-    conn = sqlite3.connect('gst-helper.db')
-    c = conn.cursor()
-    
-    c.execute('SELECT SUM(total_amount) FROM invoices')
-    total = c.fetchone()[0] or 0.0
+    with get_conn() as conn:
+        # Both sums in one pass over the table
+        total, gst_eligible = conn.execute('''
+            SELECT SUM(total_amount), SUM(CASE WHEN gst_eligible = 1 THEN gst_amount END)
+            FROM invoices
+        ''').fetchone()
     
-    c.execute('SELECT SUM(gst_amount) FROM invoices WHERE gst_eligible = 1')
-    gst_eligible = c.fetchone()[0] or 0.0
+    total = total or 0.0
+    gst_eligible = gst_eligible or 0.0
     
-    conn.close()
     return {
         "total": total,
         "gst_eligible": gst_eligible
@@ -262,12 +456,11 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "ok", "message": "Server is running"}
+    return {"status": "ok", "message": "Server is running", "db_pool": gst_pool.stats()}
 
-@app.get("/api/gst-summary")
-async def get_gst_summary():
-    try:
-        conn = sqlite3.connect('gst-helper.db')
+def get_gst_totals():
+    """Return (GST collected from invoices, GST paid on expenses)."""
+    with get_conn() as conn:
         c = conn.cursor()
         
         # Get total GST collected (from invoices)
@@ -277,12 +470,17 @@ async def get_gst_summary():
         # Get total GST paid (from expenses)
         c.execute('SELECT SUM(gst_amount) FROM expenses WHERE is_gst_eligible = 1')
         gst_paid = c.fetchone()[0] or 0.0
+    
+    return gst_collected, gst_paid
+
+@app.get("/api/gst-summary")
+async def get_gst_summary():
+    try:
+        gst_collected, gst_paid = await asyncio.to_thread(get_gst_totals)
         
         # Calculate net GST
         net_gst = gst_collected - gst_paid
         
-        conn.close()
-        
         return {
             "gst_collected": gst_collected,
             "gst_paid": gst_paid,
@@ -330,33 +528,67 @@ async def get_common_deductions():
         logger.error(f"Error fetching common deductions: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-def extract_text_from_image(image_data: bytes, content_type: str) -> str:
-    """Extract text from image using pytesseract"""
+# Uploaded photos and scans are shrunk to at most IMAGE_OCR_MAX_SIDE pixels
+# on their longer side; past that tesseract only spends more time on them.
+# They're read as one uniform block of text with the LSTM engine, which
+# skips page layout analysis and keeps a label on the same line as its amount.
+IMAGE_OCR_MAX_SIDE = 2000
+IMAGE_OCR_CONFIG = '--oem 1 --psm 6'
+
+# tesserocr API the current OCR_POOL worker reads uploaded images with,
+# created on its first image with the same settings as IMAGE_OCR_CONFIG
+image_tesseract_api = None
+
+def ocr_image(image_path: str) -> str:
+    """Decode, binarize and OCR an uploaded image (runs in an OCR_POOL worker)"""
+    global image_tesseract_api
+    with Image.open(image_path) as image:
+        logger.debug("Image format: %s, Size: %s, Mode: %s", image.format, image.size, image.mode)
+        
+        scale = min(1.0, IMAGE_OCR_MAX_SIDE / max(image.size))
+        target_size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        # Have libjpeg decode JPEGs straight to grayscale, and scale them down
+        # as far as it can towards the target size while decoding
+        if image.format == 'JPEG':
+            image.draft('L', target_size)
+        # Transparent areas are read as white paper, not as the (often black)
+        # colour underneath them
+        if image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info:
+            image = image.convert('RGBA')
+            image = Image.alpha_composite(Image.new('RGBA', image.size, 'white'), image)
+        if image.mode != 'L':
+            image = image.convert('L')
+        if image.size != target_size:
+            image = image.resize(target_size, Image.LANCZOS)
+        
+        image = preprocess_page(image)
+        if PyTessBaseAPI is None:
+            return pytesseract.image_to_string(image, config=IMAGE_OCR_CONFIG)
+        if image_tesseract_api is None:
+            image_tesseract_api = PyTessBaseAPI(lang='eng', psm=PSM.SINGLE_BLOCK, oem=OEM.LSTM_ONLY)
+        image_tesseract_api.SetImage(image)
+        return image_tesseract_api.GetUTF8Text()
+
+def extract_text_from_image(image_path: str, content_type: str) -> str:
+    """Extract text from an uploaded image file using pytesseract"""
     try:
         # Handle PDF files
         if content_type == 'application/pdf':
-            return extract_text_from_pdf(image_data)
+            return extract_text_from_pdf(image_path)
 
         # Log the size of the received data
-        logger.debug(f"Received image data size: {len(image_data)} bytes")
-        
-        # Try to open the image
-        image = Image.open(io.BytesIO(image_data))
-        logger.debug(f"Image format: {image.format}, Size: {image.size}, Mode: {image.mode}")
-        
-        # Convert image to RGB if it's not
-        if image.mode != 'RGB':
-            logger.debug(f"Converting image from {image.mode} to RGB")
-            image = image.convert('RGB')
+        logger.debug("Received image data size: %d bytes", os.path.getsize(image_path))
         
         # Check if tesseract is installed and accessible
-        if not os.path.exists('/usr/bin/tesseract'):
+        if not TESSERACT_OK:
             raise Exception("Tesseract is not installed or not accessible")
         
-        # Extract text
+        # Extract text; decoding and OCR run in OCR_POOL so they neither
+        # hold this process's GIL nor exceed the OCR worker budget, and the
+        # worker reads the file itself rather than being sent its bytes
         logger.debug("Starting OCR processing...")
-        text = pytesseract.image_to_string(image)
-        logger.debug(f"Extracted text length: {len(text)}")
+        text = OCR_POOL.submit(ocr_image, image_path).result()
+        logger.debug("Extracted text length: %d", len(text))
         
         if not text.strip():
             raise Exception("No text was extracted from the image")
@@ -364,96 +596,281 @@ def extract_text_from_image(image_data: bytes, content_type: str) -> str:
         return text
         
     except UnidentifiedImageError as e:
-        logger.error("Failed to identify image format")
-        logger.error(traceback.format_exc())
+        logger.exception("Failed to identify image format")
         raise HTTPException(status_code=400, detail="Invalid image format or corrupted file")
     except Exception as e:
-        logger.error(f"Error in extract_text_from_image: {str(e)}")
-        logger.error(traceback.format_exc())
+        logger.exception("Error in extract_text_from_image: %s", e)
         raise
 
-def extract_text_from_pdf(pdf_data: bytes) -> str:
-    """Extract text from PDF using pdf2image and pytesseract"""
+# tesserocr API of the current OCR_POOL worker, created on its first page
+tesseract_api = None
+
+# Most pages handed to a single tesseract run; very long image lists can hang it
+OCR_BATCH_SIZE = 50
+
+# PDF pages are rendered at PDF_RENDER_DPI, which is plenty for printed
+# invoices; a page that comes back with fewer than MIN_PAGE_TEXT_CHARS letters
+# and digits is rendered and read again at PDF_RETRY_DPI
+PDF_RENDER_DPI = 150
+PDF_RETRY_DPI = 300
+# Scanner PDFs sometimes declare one point per scanned pixel, which at these
+# DPIs renders pages tens of thousands of pixels across. Pages are capped at
+# PDF_OCR_MAX_SIDE pixels, which still leaves A4 at PDF_RETRY_DPI untouched;
+# PDFium caps each page, the pdf2image fallback lowers the DPI of the whole
+# document to fit its first page.
+PDF_OCR_MAX_SIDE = 3600
+MIN_PAGE_TEXT_CHARS = 10
+
+def otsu_threshold(histogram: List[int]) -> int:
+    """Grey level that best splits a 256-bin histogram into ink and paper (Otsu's method)"""
+    total = sum(histogram)
+    total_sum = sum(level * count for level, count in enumerate(histogram))
+    dark_count = dark_sum = 0
+    # A blank page has nothing to split, so keep the old fixed threshold
+    best_threshold, best_variance = 128, 0.0
+    for level, count in enumerate(histogram):
+        dark_count += count
+        light_count = total - dark_count
+        if not dark_count:
+            continue
+        if not light_count:
+            break
+        dark_sum += level * count
+        dark_mean = dark_sum / dark_count
+        light_mean = (total_sum - dark_sum) / light_count
+        variance = dark_count * light_count * (dark_mean - light_mean) ** 2
+        if variance > best_variance:
+            best_threshold, best_variance = level + 1, variance
+    return best_threshold
+
+def preprocess_page(image: Image.Image) -> Image.Image:
+    """Grayscale, stretch and threshold a page image for better OCR"""
+    if image.mode != 'L':
+        image = image.convert('L')  # Convert to grayscale
+    # Stretch faded or dark scans over the full range; the outer 1% at each
+    # end is clipped
+    image = ImageOps.autocontrast(image, cutoff=1)
+    # Threshold where this page's ink and paper separate best rather than at
+    # a fixed mid-grey. PIL turns the lambda into a 256-entry lookup table,
+    # so it runs once per grey level, not per pixel.
+    threshold = otsu_threshold(image.histogram())
+    return image.point(lambda x: 0 if x < threshold else 255, '1')
+
+def ocr_page(image_path: str) -> str:
+    """OCR one rendered PDF page (runs in an OCR_POOL worker)"""
+    global tesseract_api
+    with Image.open(image_path) as image:
+        image = preprocess_page(image)
+        if PyTessBaseAPI is None:
+            return pytesseract.image_to_string(image, lang='eng')
+        if tesseract_api is None:
+            tesseract_api = PyTessBaseAPI(lang='eng', psm=PSM.AUTO)
+        tesseract_api.SetImage(image)
+        return tesseract_api.GetUTF8Text()
+
+def ocr_pages(image_paths: List[str]) -> List[str]:
+    """OCR a batch of rendered PDF pages with one tesseract run (runs in an OCR_POOL worker)"""
+    if PyTessBaseAPI is not None:
+        # tesserocr already keeps the model loaded between pages
+        return [ocr_page(path) for path in image_paths]
     try:
-        # Create a temporary file to save the PDF
-        with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as pdf_file:
-            pdf_file.write(pdf_data)
-            pdf_path = pdf_file.name
-
-        logger.debug(f"Converting PDF to images: {pdf_path}")
-        # Convert PDF to images with higher DPI for better OCR
-        images = pdf2image.convert_from_path(
-            pdf_path,
-            dpi=300,  # Higher DPI for better OCR
-            thread_count=4,  # Use multiple threads for faster processing
-            grayscale=True  # Convert to grayscale for better OCR
-        )
-        logger.debug(f"Converted PDF to {len(images)} images")
-
-        # Extract text from each image
-        text = ""
-        for i, image in enumerate(images):
-            logger.debug(f"Processing page {i+1}")
-            # Preprocess image for better OCR
-            image = image.convert('L')  # Convert to grayscale
-            image = image.point(lambda x: 0 if x < 128 else 255, '1')  # Apply threshold
-            page_text = pytesseract.image_to_string(image)
-            text += page_text + "\n"
-            logger.debug(f"Extracted {len(page_text)} characters from page {i+1}")
-
-        # Clean up temporary file
-        os.unlink(pdf_path)
-        
+        with tempfile.TemporaryDirectory() as batch_dir:
+            # Tesseract reads a .txt input as a list of images and ends each
+            # page's text with a form feed, the same as a single-image run
+            list_path = os.path.join(batch_dir, 'images.txt')
+            with open(list_path, 'w') as image_list:
+                for i, path in enumerate(image_paths):
+                    page_path = os.path.join(batch_dir, f'page_{i}.png')
+                    with Image.open(path) as image:
+                        preprocess_page(image).save(page_path)
+                    image_list.write(page_path + '\n')
+            pages = pytesseract.image_to_string(list_path, lang='eng').split('\f')
+        if len(pages) == len(image_paths) + 1:
+            return [page + '\f' for page in pages[:-1]]
+        logger.warning(f"Batch OCR returned {len(pages) - 1} pages for {len(image_paths)} images")
+    except Exception as e:
+        logger.warning(f"Batch OCR failed, falling back to one page at a time: {str(e)}")
+    return [ocr_page(path) for path in image_paths]
+
+def capped_render_dpi(pdf_path: str, dpi: int) -> int:
+    """DPI at which the first page of a PDF fits in PDF_OCR_MAX_SIDE pixels, at most dpi"""
+    try:
+        # e.g. "595.276 x 841.89 pts (A4)"
+        width, height = map(float, pdf2image.pdfinfo_from_path(pdf_path)['Page size'].split()[0:3:2])
+    except Exception as e:
+        logger.debug("Could not read PDF page size, rendering at %d DPI: %s", dpi, e)
+        return dpi
+    return max(1, min(dpi, int(PDF_OCR_MAX_SIDE * 72 / max(width, height))))
+
+def render_pdf_pages(pdf_path: str, dpi: int, output_dir: str,
+                     page_numbers: Optional[List[int]] = None, prefix: str = 'page') -> List[str]:
+    """Render PDF pages (0-based page_numbers, default all) to grayscale PNGs in output_dir; returns their paths in page order"""
+    if pdfium is None:
+        dpi = capped_render_dpi(pdf_path, dpi)
+        if page_numbers is None:
+            return pdf2image.convert_from_path(
+                pdf_path,
+                dpi=dpi,
+                fmt='png',
+                output_folder=output_dir,
+                output_file=prefix,
+                paths_only=True,
+                thread_count=os.cpu_count(),  # Render pages in parallel
+                grayscale=True  # Convert to grayscale for better OCR
+            )
+        return [
+            pdf2image.convert_from_path(
+                pdf_path,
+                dpi=dpi,
+                fmt='png',
+                output_folder=output_dir,
+                output_file=f'{prefix}_{i}',
+                paths_only=True,
+                first_page=i + 1,
+                last_page=i + 1,
+                grayscale=True
+            )[0]
+            for i in page_numbers
+        ]
+
+    # PDFium renders each page straight into a grayscale bitmap, which is
+    # freed as soon as its PNG is written
+    pdf = pdfium.PdfDocument(pdf_path)
+    try:
+        paths = []
+        for i in range(len(pdf)) if page_numbers is None else page_numbers:
+            page = pdf[i]
+            scale = min(dpi / 72, PDF_OCR_MAX_SIDE / max(page.get_size()))
+            bitmap = page.render(scale=scale, grayscale=True)
+            try:
+                path = os.path.join(output_dir, f'{prefix}_{i}.png')
+                # Only read back once by OCR, so favour speed over size
+                bitmap.to_pil().save(path, compress_level=1)
+            finally:
+                bitmap.close()
+                page.close()
+            paths.append(path)
+        return paths
+    finally:
+        pdf.close()
+
+def extract_text_from_pdf(pdf_path: str) -> str:
+    """Extract text from PDF using pytesseract on pages rendered by PDFium or pdf2image"""
+    try:
+        with tempfile.TemporaryDirectory() as output_dir:
+            logger.debug("Converting PDF to images")
+            # Render pages to files on disk instead of holding every page in memory
+            page_paths = render_pdf_pages(pdf_path, PDF_RENDER_DPI, output_dir)
+            logger.debug("Converted PDF to %d images", len(page_paths))
+
+            # Split the pages into one batch per pool worker (at most
+            # OCR_BATCH_SIZE pages each) so every worker starts tesseract once;
+            # map keeps page order
+            batch_size = min(OCR_BATCH_SIZE, max(1, -(-len(page_paths) // OCR_WORKERS)))
+            batches = [page_paths[i:i + batch_size] for i in range(0, len(page_paths), batch_size)]
+            page_texts = [page_text for batch in OCR_POOL.map(ocr_pages, batches) for page_text in batch]
+
+            # Give pages that came back (nearly) empty a second go at a higher DPI
+            retry_pages = [
+                i for i, page_text in enumerate(page_texts)
+                if sum(ch.isalnum() for ch in page_text) < MIN_PAGE_TEXT_CHARS
+            ]
+            if retry_pages:
+                logger.debug("Re-rendering %d pages at %d DPI", len(retry_pages), PDF_RETRY_DPI)
+                retry_paths = render_pdf_pages(pdf_path, PDF_RETRY_DPI, output_dir, retry_pages, prefix='retry')
+                for i, retry_text in zip(retry_pages, OCR_POOL.map(ocr_page, retry_paths)):
+                    if len(retry_text.strip()) > len(page_texts[i].strip()):
+                        page_texts[i] = retry_text
+
+            text = ""
+            for i, page_text in enumerate(page_texts):
+                text += page_text + "\n"
+                logger.debug("Extracted %d characters from page %d", len(page_text), i + 1)
+
         if not text.strip():
             raise Exception("No text was extracted from the PDF")
             
-        logger.debug(f"Total extracted text length: {len(text)}")
+        logger.debug("Total extracted text length: %d", len(text))
         return text
 
     except Exception as e:
-        logger.error(f"Error in PDF processing: {str(e)}")
-        logger.error(traceback.format_exc())
+        logger.exception("Error in PDF processing: %s", e)
         raise
 
+def compute_gst_totals(amounts: List[float]) -> tuple:
+    """Split GST-inclusive amounts into (total, gst, net); GST is 1/11th of the total."""
+    total_amount = math.fsum(amounts)
+    gst_amount = round(total_amount / 11, 2)
+    return total_amount, gst_amount, round(total_amount - gst_amount, 2)
+
+def scan_invoice_fields(text: str):
+    """Yield (field, match) for each invoice field found in text, in text order"""
+    if INVOICE_FIELDS_DB is None:
+        for match in INVOICE_FIELDS_PATTERN.finditer(text):
+            yield match.lastgroup, match
+        return
+    
+    scratch = getattr(hyperscan_scratch, 'scratch', None)
+    if scratch is None:
+        scratch = hyperscan_scratch.scratch = hyperscan.Scratch(INVOICE_FIELDS_DB)
+    data = text.encode()
+    hits = set()
+    INVOICE_FIELDS_DB.scan(
+        data,
+        match_event_handler=lambda pattern_id, start, end, flags, context: hits.add((start, pattern_id)),
+        scratch=scratch,
+    )
+    
+    # Unlike finditer, hits can overlap, as if each field were searched for
+    # separately; that only changes the result for run-together tokens such
+    # as two dates with no space between them. Offsets are in bytes, and every
+    # hit starts on an ASCII character, so the text between two hits decodes.
+    byte_pos = char_pos = 0
+    for start, pattern_id in sorted(hits):
+        char_pos += len(data[byte_pos:start].decode())
+        byte_pos = start
+        match = INVOICE_FIELD_MATCHERS[pattern_id].match(text, char_pos)
+        if match:
+            yield match.lastgroup, match
+
 def parse_invoice(text: str) -> dict:
     """Parse invoice details from extracted text."""
     try:
-        # Extract supplier - look for common patterns
-        supplier = "Unknown Supplier"
-        if "Apple Store" in text:
-            supplier = "Apple Store"
-        elif "AMART" in text or "Amart" in text:
-            supplier = "Amart Furniture"
-        elif "BUNNINGS" in text or "Bunnings" in text:
-            supplier = "Bunnings"
-        elif "OFFICEWORKS" in text or "Officeworks" in text:
-            supplier = "Officeworks"
+        # Single scan for suppliers, totals, dates and invoice/reference
+        # numbers, keeping the first hit of each field
+        found = {}
+        for field, match in scan_invoice_fields(text):
+            if field == 'invoice_keyword':
+                if 'invoice_number' not in found:
+                    number_match = INVOICE_NUMBER_PATTERN.match(text, match.start())
+                    if number_match:
+                        found['invoice_number'] = number_match.group(1)
+            elif field == 'reference_keyword':
+                if 'reference' not in found:
+                    ref_match = REFERENCE_PATTERN.match(text, match.start())
+                    if ref_match:
+                        found['reference'] = ref_match.group(1)
+            elif field not in found:
+                found[field] = match.group(field)
+        
+        # Extract supplier - the most preferred known supplier mentioned
+        supplier = next(
+            (name for field, (name, _) in zip(SUPPLIER_FIELDS, SUPPLIER_KEYWORDS) if field in found),
+            "Unknown Supplier"
+        )
         
-        # Extract total amount - look for different patterns
-        total_amount = 0.0
-        # Pattern 1: Look for "Order Total" or "Total" followed by amount
-        total_match = re.search(r'(?:Order Total|Total)\s*\$?\s*([\d,]+\.\d{2})', text, re.IGNORECASE)
-        if total_match:
-            total_amount = float(total_match.group(1).replace(',', ''))
-        else:
-            # Pattern 2: Look for amount at the end of line
-            total_match = re.search(r'\$([\d,]+\.\d{2})\s*$', text, re.MULTILINE)
-            if total_match:
-                total_amount = float(total_match.group(1).replace(',', ''))
+        # Extract total amount - the first labelled total, otherwise the
+        # first amount found at the end of a line
+        amount = found.get('total') or found.get('line_end_total')
+        amounts = [float(amount.replace(',', ''))] if amount else []
         
         # Calculate GST (10% of total)
-        gst_amount = round(total_amount / 11, 2)
-        net_amount = round(total_amount - gst_amount, 2)
+        total_amount, gst_amount, net_amount = compute_gst_totals(amounts)
         
-        # Extract date - look for different date formats
-        date_match = re.search(r'(\d{2}/\d{2}/\d{4})', text)
-        if not date_match:
-            date_match = re.search(r'(\d{2}-\d{2}-\d{4})', text)
-        if not date_match:
-            date_match = re.search(r'(\d{4}-\d{2}-\d{2})', text)
+        # Extract date - take the most preferred format that was found
+        date_str = next((found[field] for field in DATE_FIELDS if field in found), None)
             
-        if date_match:
-            date_str = date_match.group(1)
+        if date_str:
             # Convert from DD/MM/YYYY to YYYY-MM-DD
             if '/' in date_str:
                 day, month, year = date_str.split('/')
@@ -467,18 +884,10 @@ def parse_invoice(text: str) -> dict:
         else:
             invoice_date = datetime.now().strftime('%Y-%m-%d')
         
-        # Extract invoice number - look for different patterns
-        invoice_number = ""
-        invoice_match = re.search(r'(?:Invoice|Order|Sales Order)\s*#?\s*([A-Z0-9-]+)', text, re.IGNORECASE)
-        if invoice_match:
-            invoice_number = invoice_match.group(1)
-        else:
-            # Look for reference numbers
-            ref_match = re.search(r'Ref:\s*([A-Z0-9-]+)', text, re.IGNORECASE)
-            if ref_match:
-                invoice_number = ref_match.group(1)
+        # Extract invoice number, falling back to a reference number
+        invoice_number = found.get('invoice_number') or found.get('reference', "")
         
-        logger.debug(f"Parsed invoice details: supplier={supplier}, total={total_amount}, date={invoice_date}, number={invoice_number}")
+        logger.debug("Parsed invoice details: supplier=%s, total=%s, date=%s, number=%s", supplier, total_amount, invoice_date, invoice_number)
         
         return {
             "supplier": supplier,
@@ -486,20 +895,152 @@ def parse_invoice(text: str) -> dict:
             "gst_amount": gst_amount,
             "net_amount": net_amount,
             "invoice_date": invoice_date,
-            "invoice_number": invoice_number,
-            "raw_text": text
+            "invoice_number": invoice_number
         }
     except Exception as e:
-        logger.error(f"Error parsing invoice: {str(e)}")
-        logger.error(traceback.format_exc())
+        logger.exception("Error parsing invoice: %s", e)
         raise HTTPException(status_code=400, detail=f"Failed to parse invoice: {str(e)}")
 
+def run_invoice_pipeline(invoice_id: str, filename: str, content_type: str, upload_path: str, invoice_type: str,
+                         include_raw_text: bool = False):
+    """Extract, parse and save an uploaded invoice; returns (status_code, content)."""
+    # Extract text
+    try:
+        text = extract_text_from_image(upload_path, content_type)
+        logger.debug("Extracted text preview: %.200s...", text)  # Log first 200 chars
+    except Exception as e:
+        logger.error(f"Text extraction failed: {str(e)}")
+        return 500, {
+            "error": "Failed to extract text from image",
+            "detail": str(e)
+        }
+    
+    # Parse invoice
+    try:
+        result = parse_invoice(text)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Parsing result: %s", json.dumps(result, indent=2))
+        
+        # Create invoice object with the provided invoice_type
+        now = datetime.now().isoformat()
+        invoice = Invoice(
+            id=invoice_id,
+            supplier=result["supplier"],
+            total_amount=result["total_amount"],
+            gst_amount=result["gst_amount"],
+            net_amount=result["net_amount"],
+            invoice_date=result["invoice_date"],
+            invoice_number=result.get("invoice_number", ""),
+            category="Other",
+            gst_eligible=True,
+            file_path=filename,
+            created_at=now,
+            updated_at=now,
+            is_system_date=False,
+            invoice_type=invoice_type,
+            status='pending'
+        )
+        
+        # Save to database
+        if save_invoice(invoice):
+            content = {
+                "success": True,
+                "invoice": invoice.dict()
+            }
+            if include_raw_text:
+                content["raw_text"] = text
+            return 200, content
+        return 400, {
+            "error": "Duplicate invoice detected",
+            "detail": f"Invoice for supplier {invoice.supplier} with amount {invoice.total_amount} already exists for date {invoice.invoice_date}"
+        }
+            
+    except Exception as e:
+        logger.exception("Invoice parsing failed: %s", e)
+        return 500, {
+            "error": "Failed to parse invoice",
+            "detail": str(e)
+        }
+
+def create_invoice_job(job_id: str):
+    """Record a new pending job, dropping jobs older than an hour."""
+    with get_conn() as conn:
+        conn.execute("DELETE FROM invoice_jobs WHERE created_at < datetime('now', '-1 hour')")
+        conn.execute("INSERT OR REPLACE INTO invoice_jobs (id, status) VALUES (?, 'pending')", (job_id,))
+        conn.commit()
+
+def update_invoice_job(job_id: str, status: str, status_code: Optional[int] = None, result: Optional[dict] = None):
+    """Set a job's status and, once it has finished, its response."""
+    with get_conn() as conn:
+        conn.execute(
+            'UPDATE invoice_jobs SET status = ?, status_code = ?, result = ? WHERE id = ?',
+            (status, status_code, orjson.dumps(result).decode() if result is not None else None, job_id)
+        )
+        conn.commit()
+
+def get_invoice_job_row(job_id: str):
+    """Fetch (status, status_code, result) for a job, or None."""
+    with get_conn() as conn:
+        return conn.execute(
+            'SELECT status, status_code, result FROM invoice_jobs WHERE id = ?', (job_id,)
+        ).fetchone()
+
+async def run_invoice_job(job_id: str, filename: str, content_type: str, upload_path: str, *args):
+    """Run a queued invoice through the pipeline once an OCR slot frees up, then delete its upload."""
+    try:
+        try:
+            async with ocr_job_slots:
+                await asyncio.to_thread(update_invoice_job, job_id, "processing")
+                status_code, content = await asyncio.to_thread(
+                    run_invoice_pipeline, job_id, filename, content_type, upload_path, *args
+                )
+            status = "done" if status_code == 200 else "failed"
+        except asyncio.CancelledError:
+            # Cancelled on shutdown; mark the job failed so polls don't report
+            # it as pending forever. Written inline since the task is unwinding
+            try:
+                update_invoice_job(job_id, "failed", 503, {
+                    "error": "Job cancelled",
+                    "detail": "Server shut down before the invoice was processed"
+                })
+            except Exception as e:
+                logger.error(f"Failed to record cancellation of invoice job {job_id}: {str(e)}")
+            raise
+        except Exception as e:
+            logger.exception("Invoice job %s crashed: %s", job_id, e)
+            status, status_code, content = "failed", 500, {
+                "error": "Unexpected error occurred",
+                "detail": str(e)
+            }
+        await asyncio.to_thread(update_invoice_job, job_id, status, status_code, content)
+    except Exception as e:
+        logger.error(f"Failed to record result of invoice job {job_id}: {str(e)}")
+    finally:
+        os.unlink(upload_path)
+        running_invoice_jobs.discard(asyncio.current_task())
+
+# Uploads are copied to disk this many bytes at a time
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+def save_upload(file: UploadFile) -> str:
+    """Copy an upload to a temp file for the OCR pipeline to read; the caller deletes it."""
+    suffix = os.path.splitext(file.filename or '')[1]
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as upload_file:
+        try:
+            shutil.copyfileobj(file.file, upload_file, UPLOAD_CHUNK_SIZE)
+        except Exception:
+            os.unlink(upload_file.name)
+            raise
+    return upload_file.name
+
 @app.post("/process-invoice")
 @app.post("/process-invoice/{invoice_id}")
 async def process_invoice(
     invoice_id: Optional[str] = None,
     file: UploadFile = File(...),
-    invoice_type: str = Form("expense")
+    invoice_type: str = Form("expense"),
+    background: bool = Query(False),
+    debug: bool = Query(False)
 ):
     try:
         # Generate invoice_id if not provided
@@ -507,7 +1048,7 @@ async def process_invoice(
             invoice_id = str(uuid.uuid4())
             
         # Log file details
-        logger.debug(f"Processing invoice {invoice_id} - Filename: {file.filename}, Content-Type: {file.content_type}, Type: {invoice_type}")
+        logger.debug("Processing invoice %s - Filename: %s, Content-Type: %s, Type: %s", invoice_id, file.filename, file.content_type, invoice_type)
         
         # Validate file type
         allowed_types = ['image/jpeg', 'image/png', 'image/tiff', 'application/pdf']
@@ -518,84 +1059,57 @@ async def process_invoice(
                 detail=f"Unsupported file type: {file.content_type}. Supported types are: {', '.join(allowed_types)}"
             )
         
-        # Read file content
-        contents = await file.read()
-        if not contents:
+        # Uploads sent without a Content-Length get past the middleware, but
+        # the parsed part's size is known before it's read into memory
+        if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+            logger.error(f"File too large: {file.size} bytes")
+            raise HTTPException(
+                status_code=413,
+                detail=f"File too large. Maximum size is {MAX_UPLOAD_BYTES // (1024 * 1024)} MB"
+            )
+        
+        # Copy the upload to disk in chunks rather than reading it into memory;
+        # the OCR steps read it from there by path
+        upload_path = await asyncio.to_thread(save_upload, file)
+        file_size = os.path.getsize(upload_path)
+        if not file_size:
+            os.unlink(upload_path)
             logger.error("Empty file received")
             raise HTTPException(status_code=400, detail="Empty file received")
         
-        logger.debug(f"File size: {len(contents)} bytes")
+        logger.debug("File size: %d bytes", file_size)
         
-        # Extract text
-        try:
-            text = extract_text_from_image(contents, file.content_type)
-            logger.debug(f"Extracted text preview: {text[:200]}...")  # Log first 200 chars
-        except Exception as e:
-            logger.error(f"Text extraction failed: {str(e)}")
-            return JSONResponse(
-                status_code=500,
-                content={
-                    "error": "Failed to extract text from image",
-                    "detail": str(e)
-                }
+        # Hand the OCR off to a background job and let the client poll for it;
+        # the job deletes the upload when it's done
+        if background:
+            try:
+                await asyncio.to_thread(create_invoice_job, invoice_id)
+            except Exception:
+                os.unlink(upload_path)
+                raise
+            task = asyncio.create_task(
+                run_invoice_job(invoice_id, file.filename, file.content_type, upload_path, invoice_type, debug)
             )
+            running_invoice_jobs.add(task)
+            return ORJSONResponse(status_code=202, content={
+                "job_id": invoice_id,
+                "status": "pending"
+            })
         
-        # Parse invoice
+        # OCR and the database writes block, so keep them off the event loop
         try:
-            result = parse_invoice(text)
-            logger.debug(f"Parsing result: {json.dumps(result, indent=2)}")
-            
-            # Create invoice object with the provided invoice_type
-            invoice = Invoice(
-                id=invoice_id,
-                supplier=result["supplier"],
-                total_amount=result["total_amount"],
-                gst_amount=result["gst_amount"],
-                net_amount=result["net_amount"],
-                invoice_date=result["invoice_date"],
-                invoice_number=result.get("invoice_number", ""),
-                category="Other",
-                gst_eligible=True,
-                file_path=file.filename,
-                created_at=datetime.now().isoformat(),
-                updated_at=datetime.now().isoformat(),
-                is_system_date=False,
-                invoice_type=invoice_type,
-                status='pending'
-            )
-            
-            # Save to database
-            if save_invoice(invoice):
-                return JSONResponse(content={
-                    "success": True,
-                    "invoice": invoice.dict()
-                })
-            else:
-                return JSONResponse(
-                    status_code=400,
-                    content={
-                        "error": "Duplicate invoice detected",
-                        "detail": f"Invoice for supplier {invoice.supplier} with amount {invoice.total_amount} already exists for date {invoice.invoice_date}"
-                    }
-                )
-                
-        except Exception as e:
-            logger.error(f"Invoice parsing failed: {str(e)}")
-            logger.error(traceback.format_exc())
-            return JSONResponse(
-                status_code=500,
-                content={
-                    "error": "Failed to parse invoice",
-                    "detail": str(e)
-                }
+            status_code, content = await asyncio.to_thread(
+                run_invoice_pipeline, invoice_id, file.filename, file.content_type, upload_path, invoice_type, debug
             )
+        finally:
+            os.unlink(upload_path)
+        return ORJSONResponse(status_code=status_code, content=content)
             
     except HTTPException as he:
         raise he
     except Exception as e:
-        logger.error(f"Unexpected error: {str(e)}")
-        logger.error(traceback.format_exc())
-        return JSONResponse(
+        logger.exception("Unexpected error: %s", e)
+        return ORJSONResponse(
             status_code=500,
             content={
                 "error": "Unexpected error occurred",
@@ -603,50 +1117,54 @@ async def process_invoice(
             }
         )
 
-@app.get("/api/invoices")
-async def get_invoices_endpoint(status: str = None):
-    try:
-        logger.info("Fetching invoices from database")
-        conn = sqlite3.connect('gst-helper.db')
-        c = conn.cursor()
-        
+@app.get("/process-invoice/{job_id}")
+async def get_invoice_job(job_id: str):
+    """Poll a background invoice job; finished jobs return the same body as a direct upload."""
+    job = await asyncio.to_thread(get_invoice_job_row, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Invoice job not found")
+    status, status_code, result = job
+    if status in ("pending", "processing"):
+        return ORJSONResponse(status_code=202, content={"job_id": job_id, "status": status})
+    # The stored result is already serialized JSON
+    return Response(content=result, status_code=status_code, media_type="application/json")
+
+# Columns /api/invoices returns, in response key order
+INVOICE_LIST_COLUMNS = (
+    'id', 'supplier', 'invoice_date', 'total_amount', 'gst_amount', 'invoice_number',
+    'category', 'gst_eligible', 'file_path', 'created_at', 'updated_at',
+    'is_system_date', 'invoice_type'
+)
+INVOICE_LIST_SQL = f'SELECT {", ".join(INVOICE_LIST_COLUMNS)} FROM invoices'
+
+def get_invoice_rows(status: Optional[str] = None) -> List[dict]:
+    """Fetch invoices as response dicts, optionally only those with the given status."""
+    with get_conn() as conn:
         if status:
-            c.execute('SELECT * FROM invoices WHERE status = ?', (status,))
+            cursor = conn.execute(INVOICE_LIST_SQL + ' WHERE status = ?', (status,))
         else:
-            c.execute('SELECT * FROM invoices')
-            
+            cursor = conn.execute(INVOICE_LIST_SQL)
         invoices = []
-        for row in c.fetchall():
-            invoice = {
-                'id': row[0],
-                'supplier': row[1],
-                'invoice_date': row[2],
-                'total_amount': row[3],
-                'gst_amount': row[4],
-                'invoice_number': row[5],
-                'category': row[6],
-                'gst_eligible': bool(row[7]),
-                'file_path': row[8],
-                'created_at': row[9],
-                'updated_at': row[10],
-                'is_system_date': bool(row[11]),
-                'invoice_type': row[12]
-            }
-            if status:
-                invoice['status'] = status
-            else:
-                invoice['status'] = 'pending'
+        # Built straight off the cursor, so the rows are never held as a list too
+        for row in cursor:
+            invoice = dict(zip(INVOICE_LIST_COLUMNS, row))
+            invoice['gst_eligible'] = bool(invoice['gst_eligible'])
+            invoice['is_system_date'] = bool(invoice['is_system_date'])
+            invoice['status'] = status or 'pending'
             invoices.append(invoice)
-            
-        return {"invoices": invoices}
+        return invoices
+
+@app.get("/api/invoices")
+async def get_invoices_endpoint(status: str = None):
+    try:
+        invoices = await asyncio.to_thread(get_invoice_rows, status)
+        logger.info("Fetched %d invoices", len(invoices))
+        # Already plain JSON types, so skip FastAPI's jsonable_encoder pass
+        return ORJSONResponse(content={"invoices": invoices})
         
     except Exception as e:
-        logger.error(f"Error getting invoices: {str(e)}")
-        logger.error(traceback.format_exc())
+        logger.exception("Error getting invoices: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if conn:
-            conn.close()
 
 @app.post("/api/invoices")
 async def create_invoice(invoice: dict):
@@ -655,53 +1173,100 @@ async def create_invoice(invoice: dict):
         invoice_obj = Invoice(**invoice)
         
         # Save the invoice to the database
-        if save_invoice(invoice_obj):
+        if await asyncio.to_thread(save_invoice, invoice_obj):
             return {"success": True, "message": "Invoice saved successfully"}
         else:
             raise HTTPException(status_code=400, detail="Failed to save invoice")
     except Exception as e:
-        logger.error(f"Error creating invoice: {str(e)}")
-        logger.error(traceback.format_exc())
+        logger.exception("Error creating invoice: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/invoices/bulk")
+async def create_invoices_bulk(invoices: List[Invoice]):
+    """Save a batch of invoices in one transaction, skipping duplicates"""
+    saved = await asyncio.to_thread(save_invoices_bulk, invoices)
+    return {
+        "success": True,
+        "saved": saved,
+        "skipped": len(invoices) - saved,
+        "message": f"Saved {saved} of {len(invoices)} invoices"
+    }
+
 @app.get("/api/expenses")
 async def get_expenses_endpoint():
-    expenses = get_total_expenses()
+    expenses = await asyncio.to_thread(get_total_expenses)
     return {
         "total_expenses": expenses["total"],
         "gst_eligible_expenses": expenses["gst_eligible"]
     }
 
+REPORT_SPOOL_MAX_SIZE = 8 * 1024 * 1024
+REPORT_CHUNK_SIZE = 64 * 1024
+
+# Report styles never change, so build them once rather than per request
+REPORT_STYLES = getSampleStyleSheet()
+REPORT_TITLE_STYLE = ParagraphStyle(
+    'CustomTitle',
+    parent=REPORT_STYLES['Heading1'],
+    fontSize=16,
+    spaceAfter=30
+)
+REPORT_SUMMARY_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, -1), colors.lightgrey),
+    ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 12),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+    ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+    ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+    ('FONTSIZE', (0, 1), (-1, -1), 10),
+    ('ALIGN', (0, 1), (-1, -1), 'CENTER'),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black)
+])
+REPORT_INVOICE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 10),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+    ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+    ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+    ('FONTSIZE', (0, 1), (-1, -1), 8),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black)
+])
+
+def iter_report(report):
+    """Yield a built report in chunks, closing (and deleting) it when done; a
+    plain generator, so Starlette runs the blocking reads in its threadpool"""
+    try:
+        while True:
+            chunk = report.read(REPORT_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        report.close()
+
 @app.post("/generate-report")
 async def generate_report(request: ReportRequest):
     try:
         # Get filtered invoices based on year and quarter
-        invoices = get_invoices()
-        if request.year:
-            invoices = [inv for inv in invoices if inv.invoice_date.startswith(request.year)]
-        if request.quarter:
-            quarter_start_month = (int(request.quarter) - 1) * 3 + 1
-            quarter_end_month = quarter_start_month + 2
-            invoices = [
-                inv for inv in invoices 
-                if quarter_start_month <= int(inv.invoice_date.split('-')[1]) <= quarter_end_month
-            ]
+        invoices = await asyncio.to_thread(
+            get_invoices, request.year, int(request.quarter) if request.quarter else None
+        )
 
-        # Create PDF
-        buffer = io.BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=letter)
+        # Create PDF, spilling to disk once it outgrows REPORT_SPOOL_MAX_SIZE
+        report = tempfile.SpooledTemporaryFile(max_size=REPORT_SPOOL_MAX_SIZE)
+        doc = SimpleDocTemplate(report, pagesize=letter)
         elements = []
 
         # Add title
-        styles = getSampleStyleSheet()
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=16,
-            spaceAfter=30
-        )
         title = f"GST Report - {request.year or 'All Years'} Q{request.quarter or 'All Quarters'}"
-        elements.append(Paragraph(title, title_style))
+        elements.append(Paragraph(title, REPORT_TITLE_STYLE))
         elements.append(Spacer(1, 12))
 
         # Add summary
@@ -715,20 +1280,7 @@ async def generate_report(request: ReportRequest):
             ["Net Amount", f"${net_amount:.2f}"]
         ]
         summary_table = Table(summary_data, colWidths=[200, 100])
-        summary_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, -1), colors.lightgrey),
-            ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 12),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-            ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 1), (-1, -1), 10),
-            ('ALIGN', (0, 1), (-1, -1), 'CENTER'),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
+        summary_table.setStyle(REPORT_SUMMARY_STYLE)
         elements.append(summary_table)
         elements.append(Spacer(1, 20))
 
@@ -746,67 +1298,58 @@ async def generate_report(request: ReportRequest):
                 ])
 
             invoice_table = Table(invoice_data, colWidths=[80, 150, 100, 80, 80, 80])
-            invoice_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 10),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-                ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-                ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-                ('FONTSIZE', (0, 1), (-1, -1), 8),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black)
-            ]))
+            invoice_table.setStyle(REPORT_INVOICE_STYLE)
             elements.append(invoice_table)
         else:
-            elements.append(Paragraph("No invoices found for the selected period.", styles["Normal"]))
+            elements.append(Paragraph("No invoices found for the selected period.", REPORT_STYLES["Normal"]))
 
         # Build PDF
-        doc.build(elements)
-        buffer.seek(0)
+        try:
+            await asyncio.to_thread(doc.build, elements)
+            report.seek(0)
+        except Exception:
+            report.close()
+            raise
 
         return StreamingResponse(
-            buffer,
+            iter_report(report),
             media_type="application/pdf",
             headers={
                 "Content-Disposition": f"attachment; filename=GST-Report-{request.year or 'All'}-Q{request.quarter or 'All'}.pdf"
             }
         )
     except Exception as e:
-        logger.error(f"Error generating report: {str(e)}")
-        logger.error(traceback.format_exc())
+        logger.exception("Error generating report: %s", e)
         raise HTTPException(status_code=500, detail="Failed to generate report")
 
+# The handlers from here on only do blocking SQLite and file work, so they're
+# plain defs that FastAPI runs in its threadpool instead of on the event loop
 @app.post("/cleanup-duplicates")
-async def cleanup_duplicates():
+def cleanup_duplicates():
     try:
-        conn = sqlite3.connect('gst-helper.db')
-        c = conn.cursor()
-        
-        # Find and remove duplicates based on supplier, total_amount, and invoice_date
-        c.execute('''
-            DELETE FROM invoices 
-            WHERE id NOT IN (
-                SELECT MIN(id)
-                FROM invoices
-                GROUP BY supplier, total_amount, invoice_date, category
-            )
-        ''')
+        with get_conn() as conn:
+            c = conn.cursor()
+        
+            # Find and remove duplicates based on supplier, total_amount, and invoice_date
+            c.execute('''
+                DELETE FROM invoices 
+                WHERE id NOT IN (
+                    SELECT MIN(id)
+                    FROM invoices
+                    GROUP BY supplier, total_amount, invoice_date, category
+                )
+            ''')
         
-        deleted_count = c.rowcount
-        conn.commit()
-        conn.close()
+            deleted_count = c.rowcount
+            conn.commit()
         
-        return JSONResponse(content={
-            "success": True,
-            "message": f"Removed {deleted_count} duplicate invoices"
-        })
+            return ORJSONResponse(content={
+                "success": True,
+                "message": f"Removed {deleted_count} duplicate invoices"
+            })
     except Exception as e:
-        logger.error(f"Error cleaning up duplicates: {str(e)}")
-        logger.error(traceback.format_exc())
-        return JSONResponse(
+        logger.exception("Error cleaning up duplicates: %s", e)
+        return ORJSONResponse(
             status_code=500,
             content={
                 "error": "Failed to clean up duplicates",
@@ -815,426 +1358,409 @@ async def cleanup_duplicates():
         )
 
 @app.delete("/api/invoices/{invoice_id}")
-async def delete_invoice(invoice_id: str):
+def delete_invoice(invoice_id: str):
     try:
-        conn = sqlite3.connect('gst-helper.db')
-        c = conn.cursor()
+        with get_conn() as conn:
+            c = conn.cursor()
         
-        # Check if invoice exists
-        c.execute('SELECT file_path FROM invoices WHERE id = ?', (invoice_id,))
-        result = c.fetchone()
+            # Check if invoice exists
+            c.execute('SELECT file_path FROM invoices WHERE id = ?', (invoice_id,))
+            result = c.fetchone()
         
-        if not result:
-            raise HTTPException(status_code=404, detail="Invoice not found")
+            if not result:
+                raise HTTPException(status_code=404, detail="Invoice not found")
             
-        file_path = result[0]
+            file_path = result[0]
         
-        # Delete the invoice from database
-        c.execute('DELETE FROM invoices WHERE id = ?', (invoice_id,))
-        conn.commit()
+            # Delete the invoice from database
+            c.execute('DELETE FROM invoices WHERE id = ?', (invoice_id,))
+            conn.commit()
         
-        # Delete the associated file if it exists
-        if file_path and os.path.exists(file_path):
-            os.remove(file_path)
+            # Delete the associated file if it exists
+            if file_path and os.path.exists(file_path):
+                os.remove(file_path)
             
-        return {"success": True, "message": "Invoice deleted successfully"}
+            return {"success": True, "message": "Invoice deleted successfully"}
     except Exception as e:
-        logger.error(f"Error deleting invoice: {str(e)}")
-        logger.error(traceback.format_exc())
+        logger.exception("Error deleting invoice: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if conn:
-            conn.close()
 
 @app.delete("/api/invoices")
-async def delete_all_invoices():
+def delete_all_invoices():
     try:
-        conn = sqlite3.connect('gst-helper.db')
-        c = conn.cursor()
+        with get_conn() as conn:
+            c = conn.cursor()
         
-        # Get all file paths before deleting
-        c.execute('SELECT file_path FROM invoices')
-        file_paths = [row[0] for row in c.fetchall() if row[0]]
+            # Get all file paths before deleting
+            c.execute('SELECT file_path FROM invoices')
+            file_paths = [row[0] for row in c if row[0]]
         
-        # Delete all records from the database
-        c.execute('DELETE FROM invoices')
-        conn.commit()
+            # Delete all records from the database; rowcount comes from
+            # SQLite's change counter, so no separate COUNT(*) is needed
+            c.execute('DELETE FROM invoices')
+            deleted = c.rowcount
+            conn.commit()
         
-        # Delete all associated files
+        # Delete all associated files, with the connection already back in the pool
         for file_path in file_paths:
             if os.path.exists(file_path):
                 os.remove(file_path)
-                
-        return {"success": True, "message": "All invoices deleted successfully"}
+            
+        return {"success": True, "deleted": deleted, "message": "All invoices deleted successfully"}
     except Exception as e:
-        logger.error(f"Error deleting all invoices: {str(e)}")
-        logger.error(traceback.format_exc())
+        logger.exception("Error deleting all invoices: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if conn:
-            conn.close()
+
+INSERT_EXPENSE_SQL = (
+    'INSERT INTO expenses (date, amount, gst_amount, description, category, is_gst_eligible, created_at) '
+    'VALUES (?, ?, ?, ?, ?, ?, ?)'
+)
+
+def expense_params(expense: Expense) -> tuple:
+    """INSERT_EXPENSE_SQL parameters for an expense, filling in its GST if it wasn't provided"""
+    if expense.gst_amount == 0 and expense.is_gst_eligible:
+        expense.gst_amount = compute_gst_totals([expense.amount])[1]
+    return (
+        expense.date,
+        expense.amount,
+        expense.gst_amount,
+        expense.description,
+        expense.category,
+        expense.is_gst_eligible,
+        expense.created_at
+    )
 
 @app.post("/api/expenses")
-async def create_expense(expense: Expense):
+def create_expense(expense: Expense):
     try:
-        conn = sqlite3.connect('gst-helper.db')
-        c = conn.cursor()
-        
-        # If no date provided, use current date
-        if not expense.date:
-            expense.date = datetime.now().strftime("%d/%m/%Y")
-            
-        # Calculate GST amount if not provided
-        if expense.gst_amount == 0 and expense.is_gst_eligible:
-            expense.gst_amount = round(expense.amount / 11, 2)  # GST is 1/11th of total amount
-        
-        c.execute('''
-            INSERT INTO expenses (date, amount, gst_amount, description, category, is_gst_eligible, created_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            expense.date,
-            expense.amount,
-            expense.gst_amount,
-            expense.description,
-            expense.category,
-            expense.is_gst_eligible,
-            expense.created_at
-        ))
-        
-        conn.commit()
-        expense.id = c.lastrowid
-        return {"expense": expense.dict()}
+        with get_conn() as conn:
+            c = conn.cursor()
+            c.execute(INSERT_EXPENSE_SQL, expense_params(expense))
+            conn.commit()
+            expense.id = c.lastrowid
+            return {"expense": expense.dict()}
     except Exception as e:
         logger.error(f"Error creating expense: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if conn:
-            conn.close()
+
+@app.post("/api/expenses/bulk")
+def create_expenses_bulk(expenses: List[Expense]):
+    """Save a batch of expenses in one transaction"""
+    try:
+        with get_conn() as conn:
+            conn.executemany(INSERT_EXPENSE_SQL, [expense_params(expense) for expense in expenses])
+            # The batch was inserted under one write lock, so its ids are
+            # consecutive and end at the last inserted rowid
+            last_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+            conn.commit()
+        for expense_id, expense in enumerate(expenses, last_id - len(expenses) + 1):
+            expense.id = expense_id
+        return {"expenses": [expense.dict() for expense in expenses]}
+    except Exception as e:
+        logger.exception("Error creating expenses: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/expenses/summary")
-async def get_expenses_summary(period: str = "quarter"):
+def get_expenses_summary(period: str = "quarter"):
     try:
-        conn = sqlite3.connect('gst-helper.db')
-        c = conn.cursor()
-        
-        # Calculate date range based on period
-        end_date = datetime.now()
-        if period == "month":
-            start_date = end_date - timedelta(days=30)
-        elif period == "quarter":
-            start_date = end_date - timedelta(days=90)
-        else:  # year
-            start_date = end_date - timedelta(days=365)
+        with get_conn() as conn:
+            c = conn.cursor()
+        
+            # Calculate date range based on period
+            end_date = datetime.now()
+            if period == "month":
+                start_date = end_date - timedelta(days=30)
+            elif period == "quarter":
+                start_date = end_date - timedelta(days=90)
+            else:  # year
+                start_date = end_date - timedelta(days=365)
             
-        # Get expenses within date range
-        c.execute('''
-            SELECT id, date, amount, gst_amount, description, category, is_gst_eligible
-            FROM expenses
-            WHERE date BETWEEN ? AND ?
-        ''', (start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')))
-        
-        expenses = c.fetchall()
-        
-        # Calculate totals
-        total_expenses = sum(exp[2] for exp in expenses)  # amount
-        total_gst_claimable = sum(exp[3] for exp in expenses)  # gst_amount
-        gst_eligible_expenses = sum(exp[2] for exp in expenses if exp[6])  # amount where is_gst_eligible
-        non_gst_expenses = sum(exp[2] for exp in expenses if not exp[6])  # amount where not is_gst_eligible
-        
-        # Calculate category summary
-        category_summary = {}
-        for exp in expenses:
-            category = exp[5]  # category
-            amount = exp[2]  # amount
-            gst_amount = exp[3]  # gst_amount
+            # Totals, per-category sums and the response rows are all built
+            # in one pass over the expenses in the date range
+            total_expenses = total_gst_claimable = 0
+            gst_eligible_expenses = non_gst_expenses = 0
+            category_summary = {}
+            formatted_expenses = []
+            c.execute('''
+                SELECT id, date, amount, gst_amount, description, category, is_gst_eligible
+                FROM expenses
+                WHERE date BETWEEN ? AND ?
+            ''', (start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')))
+            for expense_id, date, amount, gst_amount, description, category, is_gst_eligible in c:
+                total_expenses += amount
+                total_gst_claimable += gst_amount
+                if is_gst_eligible:
+                    gst_eligible_expenses += amount
+                else:
+                    non_gst_expenses += amount
             
-            if category not in category_summary:
-                category_summary[category] = {
-                    "total": 0,
-                    "gst_amount": 0,
-                    "count": 0
-                }
-                
-            category_summary[category]["total"] += amount
-            category_summary[category]["gst_amount"] += gst_amount
-            category_summary[category]["count"] += 1
+                summary = category_summary.get(category)
+                if summary is None:
+                    summary = category_summary[category] = {
+                        "total": 0,
+                        "gst_amount": 0,
+                        "count": 0
+                    }
+                summary["total"] += amount
+                summary["gst_amount"] += gst_amount
+                summary["count"] += 1
+            
+                formatted_expenses.append({
+                    "id": expense_id,
+                    "date": date,
+                    "amount": amount,
+                    "gst_amount": gst_amount,
+                    "description": description,
+                    "category": category
+                })
         
-        # Format expenses for response
-        formatted_expenses = [
-            {
-                "id": exp[0],
-                "date": exp[1],
-                "amount": exp[2],
-                "gst_amount": exp[3],
-                "description": exp[4],
-                "category": exp[5]
+            return {
+                "total_expenses": total_expenses,
+                "total_gst_claimable": total_gst_claimable,
+                "gst_eligible_expenses": gst_eligible_expenses,
+                "non_gst_expenses": non_gst_expenses,
+                "category_summary": category_summary,
+                "expenses": formatted_expenses
             }
-            for exp in expenses
-        ]
-        
-        return {
-            "total_expenses": total_expenses,
-            "total_gst_claimable": total_gst_claimable,
-            "gst_eligible_expenses": gst_eligible_expenses,
-            "non_gst_expenses": non_gst_expenses,
-            "category_summary": category_summary,
-            "expenses": formatted_expenses
-        }
         
     except Exception as e:
-        logger.error(f"Error getting expenses summary: {str(e)}")
-        logger.error(traceback.format_exc())
+        logger.exception("Error getting expenses summary: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if conn:
-            conn.close()
 
 @app.delete("/api/expenses/clear")
-async def clear_expenses():
+def clear_expenses():
     try:
-        conn = sqlite3.connect('gst-helper.db')
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM expenses")
-        conn.commit()
-        return {"message": "All expenses cleared successfully"}
+        with get_conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM expenses")
+            deleted = cursor.rowcount
+            conn.commit()
+            return {"deleted": deleted, "message": "All expenses cleared successfully"}
     except Exception as e:
         logger.error(f"Error clearing expenses: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if conn:
-            conn.close()
 
 @app.get("/api/tax-calculations")
-async def get_tax_calculations():
+def get_tax_calculations():
     try:
-        conn = sqlite3.connect('gst-helper.db')
-        c = conn.cursor()
-        
-        c.execute('''
-            SELECT id, name, annual_income, deductions, created_at, updated_at
-            FROM tax_calculations
-            ORDER BY created_at DESC
-        ''')
-        
-        calculations = []
-        for row in c.fetchall():
-            calculations.append({
-                'id': row[0],
-                'name': row[1],
-                'annual_income': row[2],
-                'deductions': json.loads(row[3]),
-                'created_at': row[4],
-                'updated_at': row[5]
-            })
-        
-        return calculations
+        with get_conn() as conn:
+            c = conn.cursor()
+        
+            c.execute('''
+                SELECT id, name, annual_income, deductions, created_at, updated_at
+                FROM tax_calculations
+                ORDER BY created_at DESC
+            ''')
+        
+            return [
+                {
+                    'id': calculation_id,
+                    'name': name,
+                    'annual_income': annual_income,
+                    'deductions': json.loads(deductions),
+                    'created_at': created_at,
+                    'updated_at': updated_at
+                }
+                for calculation_id, name, annual_income, deductions, created_at, updated_at in c
+            ]
     except Exception as e:
         logger.error(f"Error fetching tax calculations: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if conn:
-            conn.close()
 
 @app.get("/api/tax-calculations/{calculation_id}")
-async def get_tax_calculation(calculation_id: int):
+def get_tax_calculation(calculation_id: int):
     try:
-        conn = sqlite3.connect('gst-helper.db')
-        c = conn.cursor()
+        with get_conn() as conn:
+            c = conn.cursor()
         
-        c.execute('''
-            SELECT id, name, annual_income, deductions, created_at, updated_at
-            FROM tax_calculations
-            WHERE id = ?
-        ''', (calculation_id,))
+            c.execute('''
+                SELECT id, name, annual_income, deductions, created_at, updated_at
+                FROM tax_calculations
+                WHERE id = ?
+            ''', (calculation_id,))
         
-        row = c.fetchone()
-        if not row:
-            raise HTTPException(status_code=404, detail="Calculation not found")
+            row = c.fetchone()
+            if not row:
+                raise HTTPException(status_code=404, detail="Calculation not found")
         
-        return {
-            'id': row[0],
-            'name': row[1],
-            'annual_income': row[2],
-            'deductions': json.loads(row[3]),
-            'created_at': row[4],
-            'updated_at': row[5]
-        }
+            return {
+                'id': row[0],
+                'name': row[1],
+                'annual_income': row[2],
+                'deductions': json.loads(row[3]),
+                'created_at': row[4],
+                'updated_at': row[5]
+            }
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error fetching tax calculation: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if conn:
-            conn.close()
 
 @app.post("/api/tax-calculations")
-async def create_tax_calculation(calculation: TaxCalculation):
+def create_tax_calculation(calculation: TaxCalculation):
     try:
-        conn = sqlite3.connect('gst-helper.db')
-        c = conn.cursor()
-        
-        c.execute('''
-            INSERT INTO tax_calculations (name, annual_income, deductions)
-            VALUES (?, ?, ?)
-        ''', (
-            calculation.name,
-            calculation.annual_income,
-            json.dumps(calculation.deductions)
-        ))
-        
-        conn.commit()
-        calculation_id = c.lastrowid
-        
-        return {
-            'id': calculation_id,
-            'name': calculation.name,
-            'annual_income': calculation.annual_income,
-            'deductions': calculation.deductions,
-            'created_at': datetime.now().isoformat(),
-            'updated_at': datetime.now().isoformat()
-        }
+        with get_conn() as conn:
+            c = conn.cursor()
+        
+            c.execute('''
+                INSERT INTO tax_calculations (name, annual_income, deductions)
+                VALUES (?, ?, ?)
+            ''', (
+                calculation.name,
+                calculation.annual_income,
+                json.dumps(calculation.deductions)
+            ))
+        
+            conn.commit()
+            calculation_id = c.lastrowid
+        
+            now = datetime.now().isoformat()
+            return {
+                'id': calculation_id,
+                'name': calculation.name,
+                'annual_income': calculation.annual_income,
+                'deductions': calculation.deductions,
+                'created_at': now,
+                'updated_at': now
+            }
     except Exception as e:
         logger.error(f"Error creating tax calculation: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if conn:
-            conn.close()
 
 @app.put("/invoices/{invoice_id}")
-async def update_invoice(invoice_id: str, invoice: dict):
+def update_invoice(invoice_id: str, invoice: dict):
     try:
-        conn = sqlite3.connect('gst-helper.db')
-        c = conn.cursor()
-        
-        # First check if the invoice exists
-        c.execute('SELECT id FROM invoices WHERE id = ?', (str(invoice_id),))
-        if not c.fetchone():
-            return JSONResponse(
-                status_code=404,
-                content={
-                    "error": "Invoice not found",
-                    "detail": f"Invoice with ID {invoice_id} does not exist",
-                    "code": "INVOICE_NOT_FOUND"
-                }
-            )
-        
-        # Validate required fields
-        required_fields = ['supplier', 'total_amount', 'gst_amount', 'net_amount', 'invoice_date']
-        missing_fields = [field for field in required_fields if field not in invoice]
-        if missing_fields:
-            return JSONResponse(
-                status_code=400,
-                content={
-                    "error": "Missing required fields",
-                    "detail": f"The following fields are required: {', '.join(missing_fields)}",
-                    "code": "MISSING_FIELDS"
-                }
-            )
+        with get_conn() as conn:
+            c = conn.cursor()
+        
+            # First check if the invoice exists
+            c.execute('SELECT id FROM invoices WHERE id = ?', (str(invoice_id),))
+            if not c.fetchone():
+                return ORJSONResponse(
+                    status_code=404,
+                    content={
+                        "error": "Invoice not found",
+                        "detail": f"Invoice with ID {invoice_id} does not exist",
+                        "code": "INVOICE_NOT_FOUND"
+                    }
+                )
         
-        # Validate data types
-        try:
-            total_amount = float(invoice['total_amount'])
-            gst_amount = float(invoice['gst_amount'])
-            net_amount = float(invoice['net_amount'])
-            
-            # Basic validation
-            if total_amount < 0 or gst_amount < 0 or net_amount < 0:
-                return JSONResponse(
+            # Validate required fields
+            required_fields = ['supplier', 'total_amount', 'gst_amount', 'net_amount', 'invoice_date']
+            missing_fields = [field for field in required_fields if field not in invoice]
+            if missing_fields:
+                return ORJSONResponse(
                     status_code=400,
                     content={
-                        "error": "Invalid amount",
-                        "detail": "Amounts cannot be negative",
-                        "code": "INVALID_AMOUNT"
+                        "error": "Missing required fields",
+                        "detail": f"The following fields are required: {', '.join(missing_fields)}",
+                        "code": "MISSING_FIELDS"
                     }
                 )
-            
-            # Validate date format
+        
+            # Validate data types
             try:
-                datetime.strptime(invoice['invoice_date'], '%Y-%m-%d')
+                total_amount = float(invoice['total_amount'])
+                gst_amount = float(invoice['gst_amount'])
+                net_amount = float(invoice['net_amount'])
+            
+                # Basic validation
+                if total_amount < 0 or gst_amount < 0 or net_amount < 0:
+                    return ORJSONResponse(
+                        status_code=400,
+                        content={
+                            "error": "Invalid amount",
+                            "detail": "Amounts cannot be negative",
+                            "code": "INVALID_AMOUNT"
+                        }
+                    )
+            
+                # Validate date format
+                try:
+                    datetime.strptime(invoice['invoice_date'], '%Y-%m-%d')
+                except ValueError:
+                    return ORJSONResponse(
+                        status_code=400,
+                        content={
+                            "error": "Invalid date format",
+                            "detail": "Date must be in YYYY-MM-DD format",
+                            "code": "INVALID_DATE_FORMAT"
+                        }
+                    )
+            
             except ValueError:
-                return JSONResponse(
+                return ORJSONResponse(
                     status_code=400,
                     content={
-                        "error": "Invalid date format",
-                        "detail": "Date must be in YYYY-MM-DD format",
-                        "code": "INVALID_DATE_FORMAT"
+                        "error": "Invalid data type",
+                        "detail": "Amount fields must be valid numbers",
+                        "code": "INVALID_DATA_TYPE"
                     }
                 )
-            
-        except ValueError:
-            return JSONResponse(
-                status_code=400,
-                content={
-                    "error": "Invalid data type",
-                    "detail": "Amount fields must be valid numbers",
-                    "code": "INVALID_DATA_TYPE"
-                }
-            )
         
-        # Update the invoice
-        c.execute('''
-            UPDATE invoices 
-            SET supplier = ?,
-                total_amount = ?,
-                gst_amount = ?,
-                net_amount = ?,
-                invoice_date = ?,
-                invoice_number = ?,
-                category = ?,
-                gst_eligible = ?,
-                updated_at = ?
-            WHERE id = ?
-        ''', (
-            invoice.get('supplier'),
-            total_amount,
-            gst_amount,
-            net_amount,
-            invoice.get('invoice_date'),
-            invoice.get('invoice_number', ''),
-            invoice.get('category', 'Other'),
-            invoice.get('gst_eligible', True),
-            datetime.now().isoformat(),
-            str(invoice_id)
-        ))
-        
-        conn.commit()
-        
-        # Fetch the updated invoice
-        c.execute('''
-            SELECT id, supplier, total_amount, gst_amount, net_amount, 
-                   invoice_date, invoice_number, category, gst_eligible, 
-                   created_at, updated_at, is_system_date, invoice_type, status
-            FROM invoices 
-            WHERE id = ?
-        ''', (str(invoice_id),))
-        
-        updated_invoice = c.fetchone()
-        
-        return JSONResponse(content={
-            "success": True,
-            "message": f"Invoice {invoice_id} updated successfully",
-            "invoice": {
-                "id": updated_invoice[0],
-                "supplier": updated_invoice[1],
-                "total_amount": updated_invoice[2],
-                "gst_amount": updated_invoice[3],
-                "net_amount": updated_invoice[4],
-                "invoice_date": updated_invoice[5],
-                "invoice_number": updated_invoice[6],
-                "category": updated_invoice[7],
-                "gst_eligible": bool(updated_invoice[8]),
-                "created_at": updated_invoice[9],
-                "updated_at": updated_invoice[10],
-                "is_system_date": bool(updated_invoice[11]),
-                "invoice_type": updated_invoice[12],
-                "status": updated_invoice[13]
-            }
-        })
+            # Update the invoice
+            c.execute('''
+                UPDATE invoices 
+                SET supplier = ?,
+                    total_amount = ?,
+                    gst_amount = ?,
+                    net_amount = ?,
+                    invoice_date = ?,
+                    invoice_number = ?,
+                    category = ?,
+                    gst_eligible = ?,
+                    updated_at = ?
+                WHERE id = ?
+            ''', (
+                invoice.get('supplier'),
+                total_amount,
+                gst_amount,
+                net_amount,
+                invoice.get('invoice_date'),
+                invoice.get('invoice_number', ''),
+                invoice.get('category', 'Other'),
+                invoice.get('gst_eligible', True),
+                datetime.now().isoformat(),
+                str(invoice_id)
+            ))
+        
+            conn.commit()
+        
+            # Fetch the updated invoice
+            c.execute('''
+                SELECT id, supplier, total_amount, gst_amount, net_amount, 
+                       invoice_date, invoice_number, category, gst_eligible, 
+                       created_at, updated_at, is_system_date, invoice_type, status
+                FROM invoices 
+                WHERE id = ?
+            ''', (str(invoice_id),))
+        
+            updated_invoice = c.fetchone()
+        
+            return ORJSONResponse(content={
+                "success": True,
+                "message": f"Invoice {invoice_id} updated successfully",
+                "invoice": {
+                    "id": updated_invoice[0],
+                    "supplier": updated_invoice[1],
+                    "total_amount": updated_invoice[2],
+                    "gst_amount": updated_invoice[3],
+                    "net_amount": updated_invoice[4],
+                    "invoice_date": updated_invoice[5],
+                    "invoice_number": updated_invoice[6],
+                    "category": updated_invoice[7],
+                    "gst_eligible": bool(updated_invoice[8]),
+                    "created_at": updated_invoice[9],
+                    "updated_at": updated_invoice[10],
+                    "is_system_date": bool(updated_invoice[11]),
+                    "invoice_type": updated_invoice[12],
+                    "status": updated_invoice[13]
+                }
+            })
     except Exception as e:
-        logger.error(f"Error updating invoice: {str(e)}")
-        logger.error(traceback.format_exc())
-        return JSONResponse(
+        logger.exception("Error updating invoice: %s", e)
+        return ORJSONResponse(
             status_code=500,
             content={
                 "error": "Failed to update invoice",
@@ -1242,22 +1768,30 @@ async def update_invoice(invoice_id: str, invoice: dict):
                 "code": "INTERNAL_SERVER_ERROR"
             }
         )
-    finally:
-        conn.close()
 
 if __name__ == "__main__":
     # Initialize database
     init_db()
     migrate_db()
+    init_gst_db()
     
     # Get SSL configuration
     ssl_config = get_uvicorn_ssl_config()
     
-    # Start the server with HTTPS
+    # Start the server with HTTPS: one worker per core (WORKERS) on uvloop and
+    # httptools by default; RELOAD=1 runs a single auto-reloading dev server
+    reload = os.getenv('RELOAD', '').lower() in ('1', 'true', 'yes')
+    workers = 1 if reload else WORKERS
+    # Inherited by the workers, which size their OCR pools from it
+    os.environ['WEB_CONCURRENCY'] = str(workers)
     uvicorn.run(
         "main:app",
         host=HOST,
         port=PORT,
         **ssl_config,
-        reload=True
+        reload=reload,
+        workers=workers,
+        loop="uvloop",
+        http="httptools",
+        log_level="info"
     ) 
\ No newline at end of file